@@ -2,9 +2,11 @@ import os
 import sys
 import subprocess
 import threading
+import queue
+import multiprocessing
 import pandas as pd
 import numpy as np
-import EntropyHub as EH
+from EntropyBatch import BatchExecutor, apen_task
 import tkinter as tk
 from tkinter import filedialog, messagebox, scrolledtext, simpledialog
 from tkinter import ttk
@@ -79,6 +81,12 @@ class ApproxEntropyApp:
         self.output_style.set("Per Segment")
         self.output_style.grid(row=2, column=1, sticky='w')
 
+        # 平行處理的程序數；1 時在背景執行緒中依序計算
+        ttk.Label(param_frame, text="Workers:").grid(row=3, column=0, sticky='w')
+        self.entry_workers = ttk.Entry(param_frame, width=10)
+        self.entry_workers.insert(0, str(os.cpu_count() or 1))
+        self.entry_workers.grid(row=3, column=1, sticky='w', padx=5)
+
         # Open folder checkbox
         self.open_folder_flag = tk.BooleanVar(value=False)
         ttk.Checkbutton(container, text="Open folder after export", variable=self.open_folder_flag).pack(anchor='w', padx=10, pady=(5, 10))
@@ -90,6 +98,8 @@ class ApproxEntropyApp:
         self.progress.pack(fill='x', pady=5)
         self.log = scrolledtext.ScrolledText(progress_frame, height=15, wrap='word')
         self.log.pack(fill='both', expand=True)
+        self.progress_queue = queue.Queue()
+        BatchExecutor.poll_progress(master, self.progress_queue, self.log_message, self.progress)
 
         # Start button
         ttk.Button(container, text="Start Calculation", command=self.start).pack(pady=10)
@@ -157,56 +167,53 @@ class ApproxEntropyApp:
         ovl = int(self.entry_ovl.get()) if win_flag else None
         out_style = self.output_style.get() if win_flag else None
         open_folder = self.open_folder_flag.get()
-        threading.Thread(target=self.process_files, args=(folder, output, m, cols, win_flag, win, ovl, out_style, open_folder), daemon=True).start()
+        try:
+            workers = int(self.entry_workers.get())
+        except ValueError:
+            messagebox.showerror("Invalid input", "Workers must be numeric.")
+            return
+        threading.Thread(target=self.process_files, args=(folder, output, m, cols, win_flag, win, ovl, out_style, open_folder, workers), daemon=True).start()
 
-    def process_files(self, folder, output, m, cols, win_flag, win, ovl, out_style, open_folder):
+    def process_files(self, folder, output, m, cols, win_flag, win, ovl, out_style, open_folder, workers=1):
         files = [os.path.join(folder, f) for f in os.listdir(folder) if f.endswith(('.xlsx', '.csv'))]
         self.progress['maximum'] = len(files)
         self.progress['value'] = 0
         results = []
 
-        for file in files:
+        # 檔案、欄位與窗口區塊分派到多個程序（r = 0.2 × 各段標準差），結果依檔案、欄位順序合併
+        executor = BatchExecutor(apen_task, {'m': m, 'r': 0.2}, win if win_flag else None,
+                                 win - ovl if win_flag else None, workers, self.progress_queue)
+        for file, file_result in zip(files, executor.run(files, cols)):
             basename = os.path.basename(file)
-            try:
-                df = pd.read_excel(file) if file.endswith(('.xls', '.xlsx')) else pd.read_csv(file)
-                row = {'Filename': basename}
-                logs = []
-
-                for col in cols:
-                    if col not in df.columns:
-                        logs.append(f"{col} skipped")
-                        continue
-                    data = df[col].dropna().values
-
-                    if win_flag:
-                        seg_results = []
-                        for start in range(0, len(data) - win + 1, win - ovl):
-                            segment = data[start:start + win]
-                            if len(segment) < m + 1: continue
-                            r = 0.2 * np.std(segment)
-                            val = EH.ApEn(segment, m, r=r)[0][-1]
-                            seg_results.append(val)
-                        if out_style == "Average Only":
-                            row[f"{col}_ApEn_avg"] = np.nanmean(seg_results)
-                        else:
-                            for i, val in enumerate(seg_results):
-                                row[f"{col}_seg{i+1}"] = val
-                        logs.append(f"{col} ({len(seg_results)} segments)")
+            if isinstance(file_result, Exception):
+                continue
+            row = {'Filename': basename}
+            logs = []
+
+            for col in cols:
+                if col not in file_result:
+                    logs.append(f"{col} skipped")
+                    continue
+                seg_results = file_result[col]
+
+                if win_flag:
+                    if out_style == "Average Only":
+                        row[f"{col}_ApEn_avg"] = np.nanmean(seg_results)
                     else:
-                        r = 0.2 * np.std(data)
-                        val = EH.ApEn(data, m, r=r)[0][-1]
-                        row[f"{col} ApEn"] = val
-                        logs.append(f"{col}={val:.4f}")
+                        for i, val in enumerate(seg_results):
+                            row[f"{col}_seg{i+1}"] = val
+                    logs.append(f"{col} ({len(seg_results)} segments)")
+                else:
+                    val = seg_results[0]
+                    row[f"{col} ApEn"] = val
+                    logs.append(f"{col}={val:.4f}")
 
-                results.append(row)
-                self.log_message(f"{basename}: " + ", ".join(logs))
-            except Exception as e:
-                self.log_message(f"Error {basename}: {e}")
-            self.progress['value'] += 1
+            results.append(row)
+            self.progress_queue.put((len(files), len(files), f"{basename}: " + ", ".join(logs)))
 
         if results:
             pd.DataFrame(results).to_excel(output, index=False)
-            self.log_message(f"Results saved to {output}")
+            self.progress_queue.put((len(files), len(files), f"Results saved to {output}"))
             messagebox.showinfo("Completed", "Calculation finished.")
 
             # 寄出結果（若有輸入 email）
@@ -255,6 +262,7 @@ class ApproxEntropyApp:
             self.log_message("❌ Email 發送失敗：" + str(e))
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     root = tk.Tk()
     app = ApproxEntropyApp(root)
     root.mainloop()
@@ -0,0 +1,292 @@
+import os
+import sys
+import time
+import queue
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+import pandas as pd
+
+from SampEnOOP import SampleEntropy
+
+
+def read_table(path):
+    """
+    读取 Excel / CSV 文件为 DataFrame。
+    """
+    return pd.read_excel(path) if path.lower().endswith(('.xls', '.xlsx')) else pd.read_csv(path)
+
+
+def _load_columns(path, cols):
+    # 子进程中读取文件，只返回存在的列（去除缺失值，float64）
+    df = read_table(path)
+    return {col: df[col].dropna().to_numpy(dtype=np.float64) for col in cols if col in df.columns}
+
+
+def _attach(shm_name):
+    # 共享内存由主进程创建并释放；子进程挂载时不向 resource_tracker 登记，避免重复清理
+    if multiprocessing.parent_process() is None:
+        return shared_memory.SharedMemory(name=shm_name)
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=shm_name, track=False)
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: None
+    try:
+        return shared_memory.SharedMemory(name=shm_name)
+    finally:
+        resource_tracker.register = register
+
+
+def _init_worker():
+    # 进程池本身已按文件/窗口块并行，子进程内的 numba 核只用单线程，避免 workers × 核数 个线程争抢 CPU
+    try:
+        import numba
+    except ImportError:
+        return
+    numba.set_num_threads(1)
+
+
+def _run_chunk(task, shm_name, length, starts, window, step, params):
+    # 子进程中挂载共享内存中的列数组（不复制），对一段窗口执行 task
+    shm = _attach(shm_name)
+    try:
+        return task(np.ndarray((length,), dtype=np.float64, buffer=shm.buf), starts, window, step, params)
+    finally:
+        try:
+            shm.close()
+        except BufferError:  # 异常回溯仍引用数组视图时，由垃圾回收释放
+            pass
+
+
+def sampen_task(data, starts, window, step, params):
+    """
+    样本熵任务。params：emb_dims（维度列表）、tolerance（"segment" 每段各自的 r，
+    "file" 整个文件固定的 r，"rolling" 滚动标准差近似）、monte_carlo（None，或整个序列时
+    sampen_monte_carlo 的 {'max_error', 'time_budget'}；time_budget 为整列所有维度合计的秒数）。
+    :return: 每个窗口一行，每行为各维度的样本熵；window 为 None 时只有整个序列一行，
+             monte_carlo 时该行为各维度的 (估计值, 置信下限, 置信上限)
+    """
+    dims = params['emb_dims']
+    if window is None and params.get('monte_carlo'):
+        # 各维度依次平分剩余时间，提前达到精度的维度把余量留给后面的维度
+        options = dict(params['monte_carlo'])
+        budget = options.get('time_budget')
+        deadline = None if budget is None else time.perf_counter() + budget
+        rows = []
+        for k, d in enumerate(dims):
+            if deadline is not None:
+                options['time_budget'] = max(0.0, deadline - time.perf_counter()) / (len(dims) - k)
+            rows.append(SampleEntropy.sampen_monte_carlo(data, d, **options)[:3])
+        return [np.array(rows)]
+    if window is None:
+        return [SampleEntropy.sampen_curve(data, dims)]
+    if len(starts) == 0 or window < max(dims) + 1:
+        return []
+    segment = data[starts[0]:starts[-1] + window]
+    mode = params.get('tolerance', 'segment')
+    if mode == 'segment':
+        return list(SampleEntropy.sampen_curve_windows(segment, dims, window, step))
+    # r 取整个文件（而非本段窗口）的默认容差，分块与否结果相同
+    return list(np.column_stack([
+        SampleEntropy.sampen_sliding(segment, d, window, step,
+                                     tolerance=None if mode == 'rolling' else SampleEntropy.default_tolerance(data, d),
+                                     approximate=mode == 'rolling')
+        for d in dims]))
+
+
+def apen_task(data, starts, window, step, params):
+    """
+    近似熵任务（EntropyHub.ApEn，r = params['r'] × 各段标准差）。params：m、r。
+    """
+    import EntropyHub as EH
+
+    m, r = params['m'], params.get('r', 0.2)
+    if window is None:
+        return [EH.ApEn(data, m, r=r * np.std(data))[0][-1]]
+    rows = []
+    for start in starts:
+        segment = data[start:start + window]
+        if len(segment) < m + 1:
+            continue
+        rows.append(EH.ApEn(segment, m, r=r * np.std(segment))[0][-1])
+    return rows
+
+
+def msen_task(data, starts, window, step, params):
+    """
+    多尺度样本熵任务（EntropyHub.MSEn，r = params['r'] × 各段标准差）。params：m、scales、r。
+    :return: 每个窗口一行，每行为各尺度的熵值
+    """
+    from EntropyHub import MSEn, MSobject
+
+    m, scales, r = params['m'], params['scales'], params.get('r', 0.2)
+    if window is None:
+        return [MSEn(data, MSobject('SampEn', m=m, r=r * np.std(data)), Scales=scales, Plotx=False)[0]]
+    rows = []
+    for start in starts:
+        segment = data[start:start + window]
+        if len(segment) < m + 1:
+            continue
+        rows.append(MSEn(segment, MSobject('SampEn', m=m, r=r * np.std(segment)), Scales=scales, Plotx=False)[0])
+    return rows
+
+
+class _InlineFuture:
+    # workers <= 1 时在当前进程直接执行，接口与 concurrent.futures.Future 相同
+    def __init__(self, fn, *args):
+        try:
+            self._result, self._error = fn(*args), None
+        except Exception as e:
+            self._result, self._error = None, e
+
+    def result(self):
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+
+class BatchExecutor:
+    """
+    把 (文件, 列, 窗口块) 任务分发到进程池：每个文件由一个子进程读取一次，
+    各列放入共享内存，窗口块任务直接挂载列数组而不复制。结果按文件、列、窗口顺序合并，
+    与 workers 数量无关；进度 (已完成文件数, 文件总数, 消息) 放入 progress 队列。
+    """
+    # 每个任务包含的窗口数；固定值使分块（及 rolling 近似结果）与 workers 数量无关
+    CHUNK_WINDOWS = 64
+    # 同时载入内存的文件数 = workers × 此值
+    FILES_PER_WORKER = 2
+
+    def __init__(self, task, params, window=None, step=None, workers=None, progress=None):
+        """
+        :param task: 模块级任务函数 task(data, starts, window, step, params) -> 行列表
+        :param params: 传给 task 的参数字典（须可 pickle）
+        :param window: 窗口长度；None 时每列整个序列为一个任务
+        :param step: 窗口步长
+        :param workers: 进程数；None 为 CPU 核数，<= 1 时在当前进程顺序执行
+        :param progress: queue.Queue 或 None
+        """
+        self.task = task
+        self.params = params
+        self.window = window
+        self.step = step
+        self.workers = (os.cpu_count() or 1) if workers is None else max(1, int(workers))
+        self.progress = progress
+
+    def _chunks(self, length):
+        if self.window is None:
+            return [np.zeros(1, dtype=np.int64)]
+        starts = np.arange(0, length - self.window + 1, self.step)
+        if len(starts) == 0:
+            return [starts]
+        return np.array_split(starts, -(-len(starts) // self.CHUNK_WINDOWS))
+
+    def _report(self, done, total, message):
+        if self.progress is not None:
+            self.progress.put((done, total, message))
+
+    def run(self, files, cols):
+        """
+        :param files: 文件路径列表
+        :param cols: 列名列表
+        :return: 与 files 同序的列表；每项为 {列名: 行列表}（按 cols 顺序，缺少的列不出现），
+                 或该文件失败时的异常对象
+        """
+        results = [None] * len(files)
+        # 使用 spawn：主进程的 numba 线程池启动后再 fork 并不安全，且与 Windows 行为一致
+        pool = (ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                    initializer=_init_worker)
+                if self.workers > 1 else None)
+
+        def submit(fn, *args):
+            return pool.submit(fn, *args) if pool is not None else _InlineFuture(fn, *args)
+
+        loading = {}   # future -> 文件序号
+        chunks = {}    # future -> (文件序号, 列名, 块序号)
+        state = {}     # 文件序号 -> {'shm': [...], 'rows': {列名: [块行列表]}, 'pending': int}
+        next_file = 0
+        done = 0
+        max_files = self.workers * self.FILES_PER_WORKER
+        try:
+            while next_file < len(files) or loading or chunks:
+                while next_file < len(files) and len(loading) + len(state) < max_files:
+                    loading[submit(_load_columns, files[next_file], cols)] = next_file
+                    next_file += 1
+                if pool is not None:
+                    finished, _ = wait(list(loading) + list(chunks), return_when=FIRST_COMPLETED)
+                else:
+                    finished = list(loading) + list(chunks)
+
+                for future in finished:
+                    if future in loading:
+                        index = loading.pop(future)
+                        try:
+                            columns = future.result()
+                        except Exception as e:
+                            results[index] = e
+                            done += 1
+                            self._report(done, len(files), f"Error {os.path.basename(files[index])}: {e}")
+                            continue
+                        entry = state[index] = {'shm': [], 'rows': {}, 'pending': 0}
+                        for col in cols:
+                            if col not in columns:
+                                continue
+                            values = columns[col]
+                            shm = shared_memory.SharedMemory(create=True, size=max(1, values.nbytes))
+                            np.ndarray(values.shape, dtype=np.float64, buffer=shm.buf)[:] = values
+                            entry['shm'].append(shm)
+                            parts = self._chunks(len(values))
+                            entry['rows'][col] = [None] * len(parts)
+                            for part, starts in enumerate(parts):
+                                chunks[submit(_run_chunk, self.task, shm.name, len(values), starts, self.window,
+                                              self.step, self.params)] = (index, col, part)
+                                entry['pending'] += 1
+                        finished_index = index if entry['pending'] == 0 else None
+                    else:
+                        index, col, part = chunks.pop(future)
+                        entry = state[index]
+                        try:
+                            entry['rows'][col][part] = future.result()
+                        except Exception as e:
+                            results[index] = e
+                        entry['pending'] -= 1
+                        finished_index = index if entry['pending'] == 0 else None
+
+                    if finished_index is not None:
+                        entry = state.pop(finished_index)
+                        for shm in entry['shm']:
+                            shm.close()
+                            shm.unlink()
+                        name = os.path.basename(files[finished_index])
+                        if results[finished_index] is None:
+                            results[finished_index] = {col: [row for rows in parts for row in rows]
+                                                       for col, parts in entry['rows'].items()}
+                            message = f"✔ {name}"
+                        else:
+                            message = f"Error {name}: {results[finished_index]}"
+                        done += 1
+                        self._report(done, len(files), message)
+        finally:
+            for entry in state.values():
+                for shm in entry['shm']:
+                    shm.close()
+                    shm.unlink()
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+        return results
+
+    @staticmethod
+    def poll_progress(master, progress, log_message, progressbar, interval=100):
+        """
+        在 Tk 主线程中定期取出进度队列，更新进度条并写入日志。
+        """
+        try:
+            while True:
+                done, total, message = progress.get_nowait()
+                progressbar['maximum'] = total
+                progressbar['value'] = done
+                log_message(message)
+        except queue.Empty:
+            pass
+        master.after(interval, BatchExecutor.poll_progress, master, progress, log_message, progressbar, interval)
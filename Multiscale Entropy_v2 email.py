@@ -3,13 +3,15 @@ import re
 import pandas as pd
 import numpy as np
 import threading
+import queue
+import multiprocessing
 import smtplib
 from email.message import EmailMessage
 import ttkbootstrap as ttk
 from ttkbootstrap.constants import *
 from tkinter import filedialog, messagebox, scrolledtext, simpledialog
 import tkinter as tk
-from EntropyHub import MSEn, MSobject
+from EntropyBatch import BatchExecutor, msen_task
 
 class MSEnGUI:
     def __init__(self, master):
@@ -77,12 +79,20 @@ class MSEnGUI:
         self.output_style.set("Average Only")
         self.output_style.grid(row=1, column=5, padx=10)
 
+        # 平行處理的程序數；1 時在背景執行緒中依序計算
+        ttk.Label(param_frame, text="Workers:").grid(row=2, column=0, sticky='e')
+        self.entry_workers = ttk.Entry(param_frame, width=6)
+        self.entry_workers.insert(0, str(os.cpu_count() or 1))
+        self.entry_workers.grid(row=2, column=1)
+
         log_frame = ttk.LabelFrame(self.master, text="Execution Log", padding=10)
         log_frame.pack(fill='both', expand=True, padx=10, pady=5)
         self.progress = ttk.Progressbar(log_frame, bootstyle="info-striped", mode="determinate")
         self.progress.pack(fill='x', padx=5, pady=5)
         self.log = scrolledtext.ScrolledText(log_frame, height=15)
         self.log.pack(fill='both', expand=True)
+        self.progress_queue = queue.Queue()
+        BatchExecutor.poll_progress(self.master, self.progress_queue, self.log_message, self.progress)
 
         ttk.Button(self.master, text="Start Batch Analysis", bootstyle=PRIMARY, command=self.start_thread).pack(pady=10)
         self.toggle_window()
@@ -132,24 +142,28 @@ class MSEnGUI:
         r = 0.2
         use_window = self.use_window.get()
         out_style = self.output_style.get()
+        workers = int(self.entry_workers.get())
         selected_cols = [cb.get() for cb in self.combo_cols if cb.get()]
         files = [f for f in os.listdir(folder) if f.endswith(('.xlsx', '.csv'))]
         self.progress['maximum'] = len(files)
 
         results_per_col = {col: [] for col in selected_cols}
 
-        for idx, file in enumerate(files):
-            path = os.path.join(folder, file)
-            df = self.safe_read_file(path)
+        # 檔案、欄位與窗口區塊分派到多個程序，每個檔案完成時經由佇列回報進度
+        executor = BatchExecutor(msen_task, {'m': m, 'scales': scales, 'r': r}, win if use_window else None,
+                                 win - ovl if use_window else None, workers, self.progress_queue)
+        paths = [os.path.join(folder, file) for file in files]
+        for file, file_result in zip(files, executor.run(paths, selected_cols)):
+            if isinstance(file_result, Exception):
+                continue
 
             for col in selected_cols:
-                if col not in df.columns:
+                if col not in file_result:
                     continue
-                data = df[col].dropna().values
+                segs = file_result[col]
 
                 if not use_window:
-                    Mobj = MSobject('SampEn', m=m, r=r * np.std(data))
-                    MSx, _ = MSEn(data, Mobj, Scales=scales, Plotx=False)
+                    MSx = segs[0]
                     row = {"File": file}
                     for i, v in enumerate(MSx):
                         row[f"MSE_Scale{i+1}"] = v
@@ -157,13 +171,6 @@ class MSEnGUI:
                     results_per_col[col].append(row)
 
                 elif out_style == "Average Only":
-                    segs = []
-                    for start in range(0, len(data) - win + 1, win - ovl):
-                        seg = data[start:start + win]
-                        if len(seg) < m + 1: continue
-                        Mobj = MSobject('SampEn', m=m, r=r * np.std(seg))
-                        MSx, _ = MSEn(seg, Mobj, Scales=scales, Plotx=False)
-                        segs.append(MSx)
                     if segs:
                         avg = np.mean(segs, axis=0)
                         row = {"File": file}
@@ -174,20 +181,11 @@ class MSEnGUI:
 
                 else:  # Per Segment
                     row = {"File": file}
-                    seg_id = 1
-                    for start in range(0, len(data) - win + 1, win - ovl):
-                        seg = data[start:start + win]
-                        if len(seg) < m + 1: continue
-                        Mobj = MSobject('SampEn', m=m, r=r * np.std(seg))
-                        MSx, _ = MSEn(seg, Mobj, Scales=scales, Plotx=False)
+                    for seg_id, MSx in enumerate(segs, start=1):
                         for i, v in enumerate(MSx):
                             row[f"MSE_Scale{i+1}_Segment{seg_id}"] = v
-                        seg_id += 1
                     results_per_col[col].append(row)
 
-            self.progress['value'] = idx + 1
-            self.log_message(f"✔ {file}")
-
         out_path = os.path.join(folder, f"MSEn_{out_style.replace(' ', '')}_Sheets.xlsx")
         with pd.ExcelWriter(out_path) as writer:
             for col, data in results_per_col.items():
@@ -196,7 +194,7 @@ class MSEnGUI:
                     cleaned_name = self.clean_sheet_name(col)
                     df_col.to_excel(writer, sheet_name=cleaned_name, index=False)
 
-        self.log_message(f"✅ Saved to {out_path}")
+        self.progress_queue.put((len(files), len(files), f"✅ Saved to {out_path}"))
 
         # 如果有填 Email，自動寄送
         if self.email_recipient:
@@ -236,7 +234,9 @@ class MSEnGUI:
             self.log_message("❌ Email 發送失敗：" + str(e))
 
 
-# Run GUI
-app = ttk.Window(themename="flatly")
-MSEnGUI(app)
-app.mainloop()
+# Run GUI（子程序會重新匯入本檔，因此只在主程序中建立視窗）
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    app = ttk.Window(themename="flatly")
+    MSEnGUI(app)
+    app.mainloop()
@@ -1,7 +1,108 @@
 import numpy as np
-import matplotlib.pyplot as plt
+
+# 0-255 每个字节中 1 的个数，用于没有 np.bitwise_count 的旧版 NumPy
+_POPCOUNT_TABLE = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1)
+
+
+_FUSED_KERNELS = {}
+
+
+def _fused_kernels():
+    """
+    融合引擎的 numba 编译核 (extrema_kernel, counts_kernel)；numba 未安装时为 None。
+    numba 的导入约占本模块导入时间的三分之一，只在首次使用融合引擎时导入。
+    """
+    if "kernels" in _FUSED_KERNELS:
+        return _FUSED_KERNELS["kernels"]
+    try:
+        from numba import njit, prange
+    except ImportError:  # numba 为可选依赖，未安装时使用 NumPy 版本
+        _FUSED_KERNELS["kernels"] = None
+        return None
+
+    @njit
+    def _fused_distance(a, i, b, j, metric):
+        # metric: 0 欧氏距离，1 切比雪夫距离（最大范数），2 曼哈顿距离
+        acc = 0.0
+        for p in range(a.shape[1]):
+            diff = a[i, p] - b[j, p]
+            if metric == 0:
+                acc += diff * diff
+            elif metric == 1:
+                acc = max(acc, abs(diff))
+            else:
+                acc += abs(diff)
+        return np.sqrt(acc) if metric == 0 else acc
+
+    @njit(parallel=True)
+    def _fused_extrema_kernel(phase_space, metric):
+        N = phase_space.shape[0]
+        col_min = np.empty(N)
+        col_max = np.empty(N)
+        for j in prange(N):
+            lo, hi = np.inf, -np.inf
+            for i in range(N):
+                d = _fused_distance(phase_space, i, phase_space, j, metric)
+                lo = min(lo, d)
+                hi = max(hi, d)
+            col_min[j] = lo
+            col_max[j] = hi
+        return col_min.min(), col_max.max()
+
+    @njit(parallel=True)
+    def _fused_counts_kernel(ps_x, ps_y, dTH_x, dTH_y, metric):
+        N = ps_x.shape[0]
+        T = dTH_x.shape[0]
+        joint = np.zeros((T, N), dtype=np.int64)
+        count_x = np.zeros((T, N), dtype=np.int64)
+        count_y = np.zeros((T, N), dtype=np.int64)
+        # 每个线程只写自己负责的列，无需加锁
+        for j in prange(N):
+            for i in range(N):
+                dx = _fused_distance(ps_x, i, ps_x, j, metric)
+                dy = _fused_distance(ps_y, i, ps_y, j, metric)
+                for t in range(T):
+                    rx = dx <= dTH_x[t]
+                    ry = dy <= dTH_y[t]
+                    if rx:
+                        count_x[t, j] += 1
+                    if ry:
+                        count_y[t, j] += 1
+                    if rx and ry:
+                        joint[t, j] += 1
+        return joint, count_x, count_y
+
+    _FUSED_KERNELS["kernels"] = (_fused_extrema_kernel, _fused_counts_kernel)
+    return _FUSED_KERNELS["kernels"]
+
 
 class RecurrenceAnalysis:
+    # 未指定内存预算时，批量/分块计算使用的默认值（MB）
+    DEFAULT_MEMORY_LIMIT_MB = 256
+    # 批量计算时每批距离矩阵的目标大小（字节）
+    BATCH_CACHE_BYTES = 4 * 2**20
+    # 支持的阈值类型："rr" 为固定重现率，"knn" 为每列固定的近邻个数
+    THRESHOLD_TYPES = ("static", "dynamic", "rr", "knn")
+    # 支持的距离度量及其对应的闵可夫斯基 p（KD 树使用）
+    METRICS = ("euclidean", "chebyshev", "manhattan")
+    MINKOWSKI_P = {"euclidean": 2, "chebyshev": np.inf, "manhattan": 1}
+    # 分块模式下以直方图选取分位数时的分箱数
+    QUANTILE_BINS = 4096
+    # 稀疏引擎 KD 树搜索半径的相对放宽量，候选点对再以统一的距离公式复核
+    SPARSE_RADIUS_SLACK = 1e-9
+    # 对称引擎把上三角按行至少分成的块数：每块只算第 start 列之后的距离，块越多多算的下三角越少
+    SYMMETRIC_BLOCKS = 8
+    # 自动估计嵌入参数：互信息的直方图分箱数，以及假近邻判据（Kennel 等）的默认值
+    AMI_BINS = 16
+    FNN_RTOL = 10.0
+    FNN_ATOL = 2.0
+    FNN_FRACTION = 0.01
+    # 重现图绘制的最大边长（像素），更大的矩阵先分块池化
+    MAX_PLOT_SIZE = 2000
+    # 替代数据检验支持的方法，以及 IAAFT 的最大迭代次数
+    SURROGATE_METHODS = ("phase", "iaaft")
+    IAAFT_MAX_ITER = 100
+
     def __init__(self, data, m, tau):
         """
         初始化 RecurrenceAnalysis 对象。
@@ -16,45 +117,942 @@ class RecurrenceAnalysis:
 
     def reconstruct_phase_space(self):
         """
-        重构相空间。
+        重构相空间（只读视图，见 embed）。
         """
-        L = len(self.data)
-        M = L - (self.m - 1) * self.tau
-        self.phase_space = np.zeros((M, self.m), dtype=np.float64)
-        for p in range(self.m):
-            self.phase_space[:, p] = self.data[np.arange(0, M) + p * self.tau]
+        self.phase_space = RecurrenceAnalysis.embed(self.data, self.m, self.tau)
         return self.phase_space
 
     @staticmethod
-    def compute_reconstruction_matrix(phase_space, threshold=None, threshold_type="dynamic"):
+    def embed(data, m, tau):
+        """
+        零拷贝的相空间嵌入，返回原数据上的只读跨步视图。
+        可直接对整段记录嵌入，各窗口的相空间即为其中连续的行切片。
+        多通道数据 (L, C) 先逐通道 z 标准化，再拼接各通道的延迟坐标（此时为副本）。
+        :param data: 一维时间序列 (L,)，或多通道序列 (L, C)
+        :param m: 嵌入维度（每个通道）
+        :param tau: 时间延迟
+        :return: 相空间 (M, m × C)，M = L - (m - 1) * tau
+        """
+        data = np.asarray(data, dtype=np.float64)
+        span = (m - 1) * tau + 1
+        if data.ndim == 1:
+            return np.lib.stride_tricks.sliding_window_view(data, span)[:, ::tau]
+        # 各通道量纲不同，标准化后距离才不会被某一通道主导
+        data = RecurrenceAnalysis._standardize(data)
+        windows = np.lib.stride_tricks.sliding_window_view(data, span, axis=0)[:, :, ::tau]
+        return windows.reshape(len(windows), -1)
+
+    @staticmethod
+    def _standardize(data):
+        """
+        逐通道 z 标准化（沿第 0 轴）；常数通道只去均值。
+        """
+        data = np.asarray(data, dtype=np.float64)
+        std = data.std(axis=0)
+        return (data - data.mean(axis=0)) / np.where(std > 0, std, 1.0)
+
+    @staticmethod
+    def average_mutual_information(data, max_tau, bins=None):
+        """
+        计算延迟 0..max_tau 的平均互信息（等宽直方图，以 np.bincount 统计联合分布）。
+        :param data: 一维时间序列
+        :param max_tau: 最大延迟
+        :param bins: 直方图分箱数，默认 AMI_BINS
+        :return: 互信息数组 (max_tau + 1,)，单位为 nat
+        """
+        data = np.asarray(data, dtype=np.float64)
+        bins = bins or RecurrenceAnalysis.AMI_BINS
+        lo, hi = data.min(), data.max()
+        scale = bins / (hi - lo) if hi > lo else 0.0
+        labels = np.minimum(((data - lo) * scale).astype(np.int64), bins - 1)
+        L = len(labels)
+        max_tau = min(max_tau, L - 1)
+
+        ami = np.zeros(max_tau + 1)
+        for lag in range(max_tau + 1):
+            n = L - lag
+            joint = np.bincount(labels[:n] * bins + labels[lag:], minlength=bins * bins).reshape(bins, bins) / n
+            p_a = joint.sum(axis=1)
+            p_b = joint.sum(axis=0)
+            nz = joint > 0
+            ami[lag] = np.sum(joint[nz] * np.log(joint[nz] / np.outer(p_a, p_b)[nz]))
+        return ami
+
+    @staticmethod
+    def estimate_tau(data, max_tau=50, bins=None):
+        """
+        以平均互信息的第一个局部极小值估计时间延迟；无极小值时取互信息最小的延迟。
+        :param data: 一维时间序列
+        :param max_tau: 搜索的最大延迟
+        :param bins: 直方图分箱数，默认 AMI_BINS
+        :return: 时间延迟 tau (>= 1)
+        """
+        ami = RecurrenceAnalysis.average_mutual_information(data, max_tau, bins)
+        if len(ami) < 2:
+            return 1
+        minima = np.flatnonzero((ami[1:-1] < ami[:-2]) & (ami[1:-1] <= ami[2:])) + 1
+        if len(minima):
+            return int(minima[0])
+        return int(np.argmin(ami[1:]) + 1)
+
+    @staticmethod
+    def false_nearest_neighbours(data, tau, max_m=10, rtol=None, atol=None):
+        """
+        计算嵌入维度 1..max_m 的假近邻比例。
+        每个维度的最近邻由 KD 树在跨步嵌入视图上查询，再用第 m+1 个坐标判断是否为假近邻。
+        :param data: 一维时间序列
+        :param tau: 时间延迟
+        :param max_m: 最大嵌入维度
+        :param rtol: 距离增长比判据，默认 FNN_RTOL
+        :param atol: 相对序列标准差的判据，默认 FNN_ATOL
+        :return: 假近邻比例数组 (max_m,)，第 k 个元素对应 m = k + 1
+        """
+        from scipy.spatial import cKDTree
+
+        data = np.asarray(data, dtype=np.float64)
+        rtol = RecurrenceAnalysis.FNN_RTOL if rtol is None else rtol
+        atol = RecurrenceAnalysis.FNN_ATOL if atol is None else atol
+        spread = data.std()
+        max_m = min(max_m, (len(data) - 2) // tau)
+
+        fractions = np.ones(max(max_m, 0))
+        for m in range(1, max_m + 1):
+            # m+1 维嵌入的前 m 列即为 m 维相空间，两者点数一致
+            extended = RecurrenceAnalysis.embed(data, m + 1, tau)
+            points = np.ascontiguousarray(extended[:, :m])
+            distances, neighbours = cKDTree(points).query(points, k=2)
+            d = distances[:, 1]
+            gap = np.abs(extended[:, m] - extended[neighbours[:, 1], m])
+            with np.errstate(divide='ignore', invalid='ignore'):
+                false = (gap > rtol * d) | (np.sqrt(d ** 2 + gap ** 2) > atol * spread)
+            fractions[m - 1] = np.mean(false)
+        return fractions
+
+    @staticmethod
+    def estimate_embedding_dimension(data, tau, max_m=10, fraction=None):
+        """
+        以假近邻比例首次不超过 fraction 的维度作为嵌入维度；均未达到时取比例最小的维度。
+        :param data: 一维时间序列
+        :param tau: 时间延迟
+        :param max_m: 最大嵌入维度
+        :param fraction: 假近邻比例阈值，默认 FNN_FRACTION
+        :return: 嵌入维度 m (>= 1)
+        """
+        fraction = RecurrenceAnalysis.FNN_FRACTION if fraction is None else fraction
+        fractions = RecurrenceAnalysis.false_nearest_neighbours(data, tau, max_m)
+        if len(fractions) == 0:
+            return 1
+        below = np.flatnonzero(fractions <= fraction)
+        return int(below[0] + 1) if len(below) else int(np.argmin(fractions) + 1)
+
+    @staticmethod
+    def estimate_embedding(data, m=None, tau=None, max_m=10, max_tau=50):
+        """
+        自动估计嵌入参数；已给定的参数保持不变（先估计 tau，再以其估计 m）。
+        :param data: 一维时间序列
+        :param m: 嵌入维度，None 表示自动估计
+        :param tau: 时间延迟，None 表示自动估计
+        :return: (m, tau)
+        """
+        if tau is None:
+            tau = RecurrenceAnalysis.estimate_tau(data, max_tau)
+        if m is None:
+            m = RecurrenceAnalysis.estimate_embedding_dimension(data, tau, max_m)
+        return m, tau
+
+    @staticmethod
+    def _block_rows(n_cols, memory_limit_mb, bytes_per_cell=32):
+        """
+        根据内存预算计算每个分块的行数。
+        默认每个元素 32 字节：距离块与同样大小的临时数组（非欧氏度量逐维累加的差值、分位数的分箱下标）
+        各 8 字节，生成下一块时上一块已释放；其余为布尔矩阵、复核带与 packbits 的临时数组。
+        :param n_cols: 距离矩阵的列数
+        :param memory_limit_mb: 内存预算（MB）
+        :param bytes_per_cell: 每个元素占用的字节数（含临时数组）
+        """
+        rows = int(memory_limit_mb * 2**20 // (n_cols * bytes_per_cell))
+        return max(1, min(rows, n_cols))
+
+    @staticmethod
+    def _pairwise_distances(points_a, points_b, metric="euclidean"):
+        """
+        计算两组相空间点之间的距离矩阵 (len(a), len(b))，支持前置的批次维度 (..., N, m)。
+        欧氏距离使用范数展开（一次矩阵乘法），误差上界见 _expansion_error；其他度量逐维累加绝对差，是精确值。
+        """
+        if metric not in RecurrenceAnalysis.METRICS:
+            raise ValueError(f"Unknown metric: {metric}")
+        if metric != "euclidean":
+            return RecurrenceAnalysis._direct_distances(points_a[..., :, None, :], points_b[..., None, :, :], metric)
+        squared_norms_a = np.einsum('...ij,...ij->...i', points_a, points_a)
+        squared_norms_b = np.einsum('...ij,...ij->...i', points_b, points_b)
+        block = np.matmul(points_a, np.ascontiguousarray(np.swapaxes(points_b, -1, -2)))
+        block *= -2
+        block += squared_norms_a[..., :, None]
+        block += squared_norms_b[..., None, :]
+        return np.sqrt(np.maximum(0, block, out=block), out=block)
+
+    @staticmethod
+    def _direct_distances(points_a, points_b, metric="euclidean"):
+        """
+        逐对计算 points_a[..., k, :] 与 points_b[..., k, :] 的距离（前置维度可广播）：
+        逐维累加差值（欧氏距离为差值平方和再开方），与融合核的运算顺序相同，结果逐位一致。
+        所有引擎都以此为准，阈值恰好等于某个距离时结果也一致。
+        """
+        distances = None
+        for p in range(points_a.shape[-1]):
+            diff = points_a[..., p] - points_b[..., p]
+            if metric == "euclidean":
+                diff *= diff
+            else:
+                np.abs(diff, out=diff)
+            if distances is None:
+                distances = diff
+            elif metric == "chebyshev":
+                np.maximum(distances, diff, out=distances)
+            else:
+                distances += diff
+        return np.sqrt(distances, out=distances) if metric == "euclidean" else distances
+
+    @staticmethod
+    def _expansion_error(points_a, points_b, metric="euclidean"):
+        """
+        范数展开距离与 _direct_distances 之差的上界：平方距离的舍入误差不超过 16·(m+2)·eps·S，
+        S 为点的最大平方范数，开方后即为距离的误差。其他度量本身就是精确值，返回 0。
+        """
+        if metric != "euclidean" or points_a.size == 0 or points_b.size == 0:
+            return 0.0
+        scale = max(np.einsum('...ij,...ij->...i', points_a, points_a).max(),
+                    np.einsum('...ij,...ij->...i', points_b, points_b).max())
+        return float(np.sqrt(16 * (points_a.shape[-1] + 2) * np.finfo(np.float64).eps * scale))
+
+    @staticmethod
+    def _refine_distances(distances, index, points_a, points_b, metric="euclidean"):
+        """
+        把 distances (..., N, M) 中 index（np.nonzero 的结果）处的距离原地换成精确值并返回这些值。
+        distances 为 points_a (..., N, m) 与 points_b (..., M, m) 的距离。
+        """
+        values = RecurrenceAnalysis._direct_distances(points_a[index[:-1]], points_b[index[:-2] + index[-1:]], metric)
+        distances[index] = values
+        return values
+
+    @staticmethod
+    def _nonzero(mask):
+        """
+        同 np.nonzero；多维稀疏掩码上按一维查找再换算下标要快得多。
+        """
+        return np.unravel_index(np.flatnonzero(mask), mask.shape)
+
+    @staticmethod
+    def _exact_extremum(distances, points_a, points_b, error, largest=True, metric="euclidean", row_extrema=None):
+        """
+        范数展开距离 (..., N, M) 在最后两维上的精确最大（或最小）值 (...)。
+        与近似极值相差 2·error 以内的元素换成精确值后再取极值，其余元素不可能是极值。
+        :param error: 距离的误差上界，见 _expansion_error
+        :param row_extrema: 单个矩阵 (N, M) 已知的每行近似极值 (N,)，只扫描其中的候选行；
+                            每个候选元素都须位于某个候选行中
+        """
+        reduce = np.max if largest else np.min
+        compare = np.greater_equal if largest else np.less_equal
+        extremum = np.asarray(reduce(distances, axis=(-2, -1)) if row_extrema is None else reduce(row_extrema))
+        if error == 0:
+            return extremum
+        bound = extremum - 2 * error if largest else extremum + 2 * error
+        if row_extrema is None:
+            index = RecurrenceAnalysis._nonzero(compare(distances, bound[..., None, None]))
+        else:
+            rows = np.flatnonzero(compare(row_extrema, bound))
+            near = np.nonzero(compare(distances[rows], bound))
+            index = (rows[near[0]], near[1])
+        values = RecurrenceAnalysis._refine_distances(distances, index, points_a, points_b, metric)
+        exact = np.full(extremum.shape, -np.inf if largest else np.inf)
+        leading = np.ravel_multi_index(index[:-2], extremum.shape) if extremum.ndim else np.zeros(len(values), int)
+        (np.maximum if largest else np.minimum).at(exact.reshape(-1), leading, values)
+        return exact
+
+    @staticmethod
+    def _exact_order_statistics(distances, approx, ranks, points_a, points_b, error, metric="euclidean", per_row=False):
+        """
+        由范数展开距离中第 ranks 小的值 approx 求精确距离中第 ranks 小的值：
+        d + 2·error 小于 approx 的距离精确值必然更小，只计数；与 approx 相差不超过 2·error 的换成精确值，
+        第 ranks 小的值即其中第 (ranks - 更小的个数) 小的。
+        :param distances: 距离 (..., N, M)
+        :param approx: (G, T)，G 为批次数（整个矩阵一起排序）或批次数 × N（per_row，每行各自排序）
+        :return: (G, T)
+        """
+        length = distances.shape[-1] if per_row else distances.shape[-1] * distances.shape[-2]
+        groups = distances.reshape(-1, length)
+        exact = np.empty(approx.shape, dtype=np.float64)
+        for t, rank in enumerate(ranks):
+            low, high = approx[:, t, None] - 2 * error, approx[:, t, None] + 2 * error
+            below = np.count_nonzero(groups < low, axis=1)
+            near = groups >= low
+            near &= groups <= high
+            flat = np.flatnonzero(near)
+            values = RecurrenceAnalysis._refine_distances(distances, np.unravel_index(flat, distances.shape),
+                                                          points_a, points_b, metric)
+            group = flat // length
+            order = np.lexsort((values, group))
+            first = np.searchsorted(group[order], np.arange(len(groups)))
+            exact[:, t] = values[order][first + rank - below]
+        return exact
+
+    @staticmethod
+    def _exact_less_equal(distances, dTH, points_a, points_b, error, metric="euclidean", out=None):
+        """
+        distances <= dTH 的精确结果（dTH 可广播到 distances）：
+        与阈值相差超过 error 的范数展开距离比较结果必然正确，只复核其余距离。
+        """
+        if error == 0:
+            return np.less_equal(distances, dTH, out=out)
+        recurrence = np.less_equal(distances, dTH - error, out=out)
+        band = np.less_equal(distances, dTH + error)
+        band ^= recurrence
+        index = RecurrenceAnalysis._nonzero(band)
+        if len(index[0]):
+            values = RecurrenceAnalysis._refine_distances(distances, index, points_a, points_b, metric)
+            recurrence[index] = values <= np.broadcast_to(dTH, distances.shape)[index]
+        return recurrence
+
+    @staticmethod
+    def _exact_recurrence(distances, dTH, points_a, points_b, error, metric="euclidean"):
+        """
+        距离 (..., N, M) 按距离阈值 (..., T, C) 二值化为 (..., T, N, M)，见 _exact_less_equal。
+        """
+        recurrence = np.empty(distances.shape[:-2] + dTH.shape[-2:-1] + distances.shape[-2:], dtype=bool)
+        for t in range(dTH.shape[-2]):
+            RecurrenceAnalysis._exact_less_equal(distances, dTH[..., t, None, :], points_a, points_b, error, metric,
+                                                 out=recurrence[..., t, :, :])
+        return recurrence
+
+    @staticmethod
+    def _distance_blocks(phase_space, block_rows, other=None, metric="euclidean", upper=False):
+        """
+        按行分块计算距离矩阵，逐块产生 (start, stop, block)。
+        给定 other 时为 phase_space 各点到 other 各点的交叉距离 (N, len(other))；
+        upper 为 True 时 block 只含第 start 列之后的各点（见 _upper_block_rows）。
+        """
+        N = len(phase_space)
+        other = phase_space if other is None else other
+        for start in range(0, N, block_rows):
+            stop = min(start + block_rows, N)
+            columns = other[start:] if upper else other
+            yield start, stop, RecurrenceAnalysis._pairwise_distances(phase_space[start:stop], columns, metric)
+
+    @staticmethod
+    def _distance_extrema(phase_space, block_rows, other=None, metric="euclidean", upper=False):
+        """
+        第一遍流式扫描，求距离矩阵的全局最小值与最大值（精确值，见 _exact_extremum）。
+        自身距离的最小值即对角线的 0；upper 块中左下角的距离与对角线也属于完整矩阵，无需屏蔽。
+        """
+        columns = phase_space if other is None else other
+        error = RecurrenceAnalysis._expansion_error(phase_space, columns, metric)
+        lo, hi = (np.inf, -np.inf) if other is not None or len(phase_space) == 0 else (0.0, -np.inf)
+        for start, stop, block in RecurrenceAnalysis._distance_blocks(phase_space, block_rows, other, metric, upper):
+            rows, cols = phase_space[start:stop], columns[start:] if upper else columns
+            if other is not None:
+                lo = min(lo, RecurrenceAnalysis._exact_extremum(block, rows, cols, error, False, metric))
+            hi = max(hi, RecurrenceAnalysis._exact_extremum(block, rows, cols, error, True, metric))
+            # 先释放本块再计算下一块，同一时刻只有一个距离块
+            del block
+        return lo, hi
+
+    @staticmethod
+    def compute_reconstruction_matrix(phase_space, threshold=None, threshold_type="dynamic", memory_limit_mb=None,
+                                      packed=False, metric="euclidean"):
         """
         计算重建矩阵 R(i, j)。
         :param phase_space: 相空间矩阵
-        :param threshold: 静态或动态的阈值
+        :param threshold: 静态或动态的阈值、重现率（"rr"）或近邻个数（"knn"）；
+                          给定阈值序列时一次距离计算得到所有阈值的结果
+        :param threshold_type: "static"、"dynamic"、"rr" 或 "knn"
+        :param memory_limit_mb: 分块模式的内存预算（MB），None 表示一次计算整个矩阵
+        :param packed: 是否返回按列打包的位矩阵（见 pack_recurrence_matrix），需要给定阈值
+        :param metric: 距离度量，"euclidean"、"chebyshev"（最大范数）或 "manhattan"
+        :return: 重建矩阵或二值化矩阵（分块模式下为布尔矩阵）；阈值序列对应 (T, N, N)
+        """
+        if memory_limit_mb is not None:
+            return RecurrenceAnalysis._compute_reconstruction_matrix_tiled(
+                phase_space, threshold, threshold_type, memory_limit_mb, packed, metric=metric)
+        if packed:
+            return RecurrenceAnalysis.pack_recurrence_matrix(
+                RecurrenceAnalysis.compute_reconstruction_matrix(phase_space, threshold, threshold_type, metric=metric))
+
+        if threshold is not None and threshold_type in RecurrenceAnalysis.THRESHOLD_TYPES:
+            recurrence = RecurrenceAnalysis._batched_recurrence(phase_space[None], threshold, threshold_type,
+                                                                metric=metric)[0]
+            return (recurrence[0] if np.ndim(threshold) == 0 else recurrence).astype(int)
+
+        return RecurrenceAnalysis._pairwise_distances(phase_space, phase_space, metric)
+
+    @staticmethod
+    def _resolve_thresholds(distances, threshold, threshold_type):
+        """
+        由批量距离矩阵 (B, N, N) 求每个阈值对应的距离阈值 (B, T, C)。
+        C 为 1（整个矩阵共用）或 N（"knn" 每列各自的阈值）。
+        """
+        thresholds = np.atleast_1d(np.asarray(threshold, dtype=np.float64))
+        B, N = len(distances), distances.shape[-1]
+        if threshold_type == "dynamic":
+            span = distances.max(axis=(-2, -1)) - distances.min(axis=(-2, -1))
+            return (span[:, None] * thresholds[None, :])[:, :, None]
+        if threshold_type == "rr":
+            # 第 k 小的距离即为重现率为 rate 时的阈值，用部分排序代替全排序
+            ranks = RecurrenceAnalysis._rate_ranks(thresholds, N * N)
+            flat = distances.reshape(B, -1)
+            return np.partition(flat, np.unique(ranks), axis=1)[:, ranks][:, :, None]
+        if threshold_type == "knn":
+            # 对称矩阵中第 j 行的第 k 近邻距离即第 j 列的阈值
+            ranks = RecurrenceAnalysis._neighbour_ranks(thresholds, N)
+            return np.partition(distances, np.unique(ranks), axis=-1)[..., ranks].transpose(0, 2, 1)
+        return np.broadcast_to(thresholds[None, :, None], (B, len(thresholds), 1))
+
+    @staticmethod
+    def _exact_thresholds(distances, points_a, points_b, threshold, threshold_type, error, metric="euclidean",
+                          self_distances=True):
+        """
+        同 _resolve_thresholds，但得到的是精确距离（_direct_distances）对应的距离阈值 (B, T, C)：
+        动态阈值的最大/最小值见 _exact_extremum，自身距离的最小值即对角线的 0；
+        重现率与近邻距离见 _exact_order_statistics。会原地修改 distances。
+        :param points_a: 行对应的点 (B, N, m)
+        :param points_b: 列对应的点 (B, M, m)
+        :param error: 距离的误差上界，见 _expansion_error
+        """
+        if error == 0:
+            return RecurrenceAnalysis._resolve_thresholds(distances, threshold, threshold_type)
+        thresholds = np.atleast_1d(np.asarray(threshold, dtype=np.float64))
+        B, N = len(distances), distances.shape[-1]
+        if threshold_type == "dynamic":
+            hi = RecurrenceAnalysis._exact_extremum(distances, points_a, points_b, error, True, metric)
+            lo = 0.0 if self_distances else RecurrenceAnalysis._exact_extremum(
+                distances, points_a, points_b, error, False, metric)
+            return ((hi - lo)[:, None] * thresholds[None, :])[:, :, None]
+        dTH = RecurrenceAnalysis._resolve_thresholds(distances, threshold, threshold_type)
+        if threshold_type == "rr":
+            ranks = RecurrenceAnalysis._rate_ranks(thresholds, N * N)
+            dTH = RecurrenceAnalysis._exact_order_statistics(distances, dTH[:, :, 0], ranks, points_a, points_b, error,
+                                                             metric)[:, :, None]
+        elif threshold_type == "knn":
+            # 第 j 列的阈值来自第 j 行
+            ranks = RecurrenceAnalysis._neighbour_ranks(thresholds, N)
+            approx = dTH.transpose(0, 2, 1).reshape(B * N, -1)
+            dTH = RecurrenceAnalysis._exact_order_statistics(distances, approx, ranks, points_a, points_b, error, metric,
+                                                             per_row=True).reshape(B, N, -1).transpose(0, 2, 1)
+        return dTH
+
+    @staticmethod
+    def _rate_ranks(rates, n_total):
+        """
+        重现率对应的距离排序位置（从 0 开始）。
+        """
+        return np.clip(np.ceil(rates * n_total).astype(np.int64) - 1, 0, n_total - 1)
+
+    @staticmethod
+    def _neighbour_ranks(neighbours, N):
+        """
+        近邻个数（含自身）对应的距离排序位置（从 0 开始）。
+        """
+        return np.clip(np.round(neighbours).astype(np.int64) - 1, 0, N - 1)
+
+    @staticmethod
+    def _distance_quantiles(phase_space, block_rows, ranks, lo, hi, other=None, metric="euclidean", upper=False):
+        """
+        分块模式下求距离矩阵中第 ranks 小的值：先流式统计直方图，
+        再只收集目标分箱附近的距离，换成精确值后做部分排序，结果与精确距离整体排序一致。
+        范数展开的误差不超过 error：目标分箱两侧各放宽 2·error 以上（widen 个分箱），
+        范围之下（之上）的距离精确值也必在分位数之下（之上），只计数。
+        upper 为 True 时只统计严格上三角的距离，ranks 为压缩布局中的位置。
+        """
+        N = len(phase_space)
+        columns = phase_space if other is None else other
+        error = RecurrenceAnalysis._expansion_error(phase_space, columns, metric)
+        n_bins = RecurrenceAnalysis.QUANTILE_BINS
+        scale = n_bins / (hi - lo) if hi > lo else 0.0
+
+        def bin_index(block):
+            # 原地运算，只多一个与距离块同样大小的临时数组；分箱下标用 int32
+            values = np.subtract(block, lo)
+            values *= scale
+            return np.clip(values, 0, n_bins - 1, out=values).astype(np.int32)
+
+        def distances():
+            for start, stop, block in RecurrenceAnalysis._distance_blocks(phase_space, block_rows, other, metric, upper):
+                yield start, stop, block, RecurrenceAnalysis._upper_mask(start, stop, N) if upper else None
+                del block
+
+        counts = np.zeros(n_bins, dtype=np.int64)
+        for _, _, block, mask in distances():
+            counts += np.bincount(bin_index(block if mask is None else block[mask]).ravel(), minlength=n_bins)
+            del block
+        bins = np.searchsorted(np.cumsum(counts), ranks, side="right")
+        widen = int(np.ceil(2 * error * scale)) + 1 if error > 0 else 0
+
+        below = np.zeros(len(ranks), dtype=np.int64)
+        candidates = [[] for _ in ranks]
+        for start, stop, block, mask in distances():
+            binned = bin_index(block)
+            rows, cols = phase_space[start:stop], columns[start:] if upper else columns
+            for t, b in enumerate(bins):
+                near, under = (binned >= b - widen) & (binned <= b + widen), binned < b - widen
+                if mask is not None:
+                    near &= mask
+                    under &= mask
+                below[t] += np.count_nonzero(under)
+                index = np.nonzero(near)
+                candidates[t].append(block[index] if error == 0 else
+                                     RecurrenceAnalysis._direct_distances(rows[index[0]], cols[index[1]], metric))
+            del block, binned
+        values = []
+        for t, rank in enumerate(ranks):
+            in_bin = np.concatenate(candidates[t])
+            values.append(np.partition(in_bin, rank - below[t])[rank - below[t]])
+        return np.array(values)
+
+    @staticmethod
+    def _neighbour_distances(phase_space, block_rows, ranks, metric="euclidean"):
+        """
+        分块计算每个点第 k 近邻的距离 (T, N)，不需要完整的距离矩阵。
+        """
+        kth = np.empty((len(ranks), len(phase_space)), dtype=np.float64)
+        error = RecurrenceAnalysis._expansion_error(phase_space, phase_space, metric)
+        for start, stop, block in RecurrenceAnalysis._distance_blocks(phase_space, block_rows, metric=metric):
+            values = np.partition(block, np.unique(ranks), axis=1)[:, ranks]
+            if error > 0:
+                values = RecurrenceAnalysis._exact_order_statistics(block, values, ranks, phase_space[start:stop],
+                                                                    phase_space, error, metric, per_row=True)
+            kth[:, start:stop] = values.T
+            del block
+        return kth
+
+    @staticmethod
+    def _compute_reconstruction_matrix_tiled(phase_space, threshold, threshold_type, memory_limit_mb, packed=False,
+                                             other=None, metric="euclidean"):
+        """
+        分块计算重建矩阵，峰值内存为 O(block × N) 而非 O(N²)。
+        动态阈值所需的最小值/最大值来自第一遍流式扫描。
+        给定 other 时计算交叉重建矩阵 (N, M)，M = len(other)，不支持 "knn"。
+        """
+        N = len(phase_space)
+        M = N if other is None else len(other)
+        block_rows = RecurrenceAnalysis._block_rows(M, memory_limit_mb)
+        if packed:
+            # 每块的行数须为 8 的倍数，打包后的字节才能直接拼接
+            block_rows = max(8, block_rows - block_rows % 8)
+
+        if threshold is None or threshold_type not in RecurrenceAnalysis.THRESHOLD_TYPES:
+            distance_matrix = np.empty((N, M), dtype=np.float64)
+            for start, stop, block in RecurrenceAnalysis._distance_blocks(phase_space, block_rows, other, metric):
+                distance_matrix[start:stop] = block
+                del block
+            return distance_matrix
+
+        thresholds = np.atleast_1d(np.asarray(threshold, dtype=np.float64))
+        if threshold_type == "dynamic":
+            lo, hi = RecurrenceAnalysis._distance_extrema(phase_space, block_rows, other, metric)
+            dTH = ((hi - lo) * thresholds)[:, None]
+        elif threshold_type == "rr":
+            lo, hi = RecurrenceAnalysis._distance_extrema(phase_space, block_rows, other, metric)
+            ranks = RecurrenceAnalysis._rate_ranks(thresholds, N * M)
+            dTH = RecurrenceAnalysis._distance_quantiles(phase_space, block_rows, ranks, lo, hi, other, metric)[:, None]
+        elif threshold_type == "knn":
+            if other is not None:
+                raise ValueError("Cross recurrence does not support knn thresholds.")
+            ranks = RecurrenceAnalysis._neighbour_ranks(thresholds, N)
+            dTH = RecurrenceAnalysis._neighbour_distances(phase_space, block_rows, ranks, metric)
+        else:
+            dTH = thresholds[:, None]
+
+        # 阈值附近的距离以精确值复核，见 _exact_less_equal
+        columns = phase_space if other is None else other
+        error = RecurrenceAnalysis._expansion_error(phase_space, columns, metric)
+        if packed:
+            n_bytes = -(-N // 64) * 8
+            recurrence_matrix = np.zeros((len(dTH), M, n_bytes), dtype=np.uint8)
+            for start, stop, block in RecurrenceAnalysis._distance_blocks(phase_space, block_rows, other, metric):
+                for t, value in enumerate(dTH):
+                    recurrence = RecurrenceAnalysis._exact_less_equal(block, value, phase_space[start:stop], columns,
+                                                                      error, metric)
+                    bits = np.packbits(recurrence.T, axis=1)
+                    recurrence_matrix[t, :, start // 8:start // 8 + bits.shape[1]] = bits
+                del block
+            recurrence_matrix = recurrence_matrix.view(np.uint64)
+        else:
+            recurrence_matrix = np.empty((len(dTH), N, M), dtype=bool)
+            for start, stop, block in RecurrenceAnalysis._distance_blocks(phase_space, block_rows, other, metric):
+                for t, value in enumerate(dTH):
+                    RecurrenceAnalysis._exact_less_equal(block, value, phase_space[start:stop], columns, error, metric,
+                                                         out=recurrence_matrix[t, start:stop])
+                del block
+
+        return recurrence_matrix[0] if np.ndim(threshold) == 0 else recurrence_matrix
+
+    @staticmethod
+    def compute_cross_recurrence_matrix(ps_x, ps_y, threshold, threshold_type="dynamic", memory_limit_mb=None,
+                                        packed=False, metric="euclidean"):
+        """
+        交叉重建矩阵 CR(i, j) = ||x_i - y_j|| <= dTH，与重建矩阵共用分块与打包位的计算。
+        两条序列须位于同一量纲（例如先做 z 标准化），嵌入维度须相同。
+        :param ps_x: X 的相空间矩阵 (N, m)
+        :param ps_y: Y 的相空间矩阵 (M, m)
+        :param threshold: 静态或动态的阈值或重现率，或阈值序列
+        :param threshold_type: "static"、"dynamic" 或 "rr"（由交叉距离决定）
+        :param memory_limit_mb: 分块的内存预算（MB）
+        :param packed: 是否返回按列打包的位矩阵 (M, ceil(N/64))
+        :param metric: 距离度量，见 compute_reconstruction_matrix
+        :return: 布尔矩阵 (N, M)；阈值序列时为 (T, N, M)
+        """
+        if threshold_type not in ("static", "dynamic", "rr"):
+            raise ValueError("Cross recurrence supports static, dynamic and rr thresholds only.")
+        return RecurrenceAnalysis._compute_reconstruction_matrix_tiled(
+            ps_x, threshold, threshold_type, memory_limit_mb or RecurrenceAnalysis.DEFAULT_MEMORY_LIMIT_MB,
+            packed, other=ps_y, metric=metric)
+
+    @staticmethod
+    def compute_joint_recurrence_matrix(AR_EEG1_BW, AR_EEG2_BW):
+        """
+        联合重建矩阵 JR = AR_X AND AR_Y，即 calculate_nlid 中的 IP。
+        布尔、0/1 整数与打包位矩阵均适用。
+        """
+        return AR_EEG1_BW & AR_EEG2_BW
+
+    @staticmethod
+    def recurrence_rate(matrix, n_rows=None):
+        """
+        重建矩阵（或交叉、联合重建矩阵）中重现点的比例。
+        :param matrix: 二值化矩阵 (..., N, M)，或打包位矩阵 (..., M, words)
+        :param n_rows: 打包位矩阵的原始行数 N
+        :return: 重现率，保留前置的批次维度
+        """
+        if matrix.dtype == np.uint64:
+            return RecurrenceAnalysis._popcount(matrix).sum(axis=-1) / (matrix.shape[-2] * n_rows)
+        return np.mean(matrix, axis=(-2, -1))
+
+    @staticmethod
+    def _upper_block_rows(N, memory_limit_mb, bytes_per_cell=32):
+        """
+        _distance_blocks(..., upper=True) 每块的行数：block 为第 start..stop 行与第 start 列之后各点的距离，
+        其中严格上三角部分（见 _upper_mask）按行展开即为压缩布局。
+        块数至少为 SYMMETRIC_BLOCKS，计算量约为完整矩阵的 (1 + 1/块数) / 2。
+        """
+        block_rows = RecurrenceAnalysis._block_rows(N, memory_limit_mb or RecurrenceAnalysis.DEFAULT_MEMORY_LIMIT_MB,
+                                                    bytes_per_cell)
+        return min(block_rows, max(1, -(-N // RecurrenceAnalysis.SYMMETRIC_BLOCKS)))
+
+    @staticmethod
+    def _upper_mask(start, stop, N):
+        return np.arange(start, N)[None, :] > np.arange(start, stop)[:, None]
+
+    @staticmethod
+    def _upper_thresholds(phase_space, block_rows, thresholds, threshold_type, metric="euclidean"):
+        """
+        由上三角距离块求动态阈值或重现率对应的距离阈值 (T,)，与分块模式相同地流式扫描，不保存距离块。
+        """
+        N = len(phase_space)
+        n_upper = N * (N - 1) // 2
+        if n_upper == 0:
+            return np.zeros_like(thresholds)
+        lo, hi = RecurrenceAnalysis._distance_extrema(phase_space, block_rows, metric=metric, upper=True)
+        if threshold_type == "dynamic":
+            # 对角线距离为 0，即最小值
+            return hi * thresholds
+        # 完整矩阵中前 N 个为对角线的 0，其余每个距离出现两次
+        ranks = RecurrenceAnalysis._rate_ranks(thresholds, N * N)
+        condensed_ranks = np.clip((ranks - N) // 2, 0, n_upper - 1)
+        quantiles = RecurrenceAnalysis._distance_quantiles(phase_space, block_rows, condensed_ranks, lo, hi,
+                                                           metric=metric, upper=True)
+        return np.where(ranks < N, 0.0, quantiles)
+
+    @staticmethod
+    def compute_condensed_recurrence_matrix(phase_space, threshold, threshold_type="dynamic", memory_limit_mb=None,
+                                            metric="euclidean"):
+        """
+        利用对称性只分块计算上三角 (i < j) 的距离，结果以 scipy pdist 的压缩布局保存，
+        计算量与内存约为完整矩阵的一半。对角线恒为重现点，不保存。
+        距离逐块二值化，不保存；动态阈值与重现率先流式扫描上三角确定阈值。
+        :param phase_space: 相空间矩阵
+        :param threshold: 静态或动态的阈值或重现率，或阈值序列
+        :param threshold_type: "static"、"dynamic" 或 "rr"
+        :param memory_limit_mb: 分块的内存预算（MB）
+        :param metric: 距离度量，见 compute_reconstruction_matrix
+        :return: 布尔向量，长度 N(N-1)/2；阈值序列时为 (T, N(N-1)/2)
+        """
+        if threshold_type not in ("static", "dynamic", "rr"):
+            raise ValueError("The condensed form supports static, dynamic and rr thresholds only.")
+        N = len(phase_space)
+        thresholds = np.atleast_1d(np.asarray(threshold, dtype=np.float64))
+        # 每个阈值另有布尔块与取出的上三角部分
+        block_rows = RecurrenceAnalysis._upper_block_rows(N, memory_limit_mb, bytes_per_cell=32 + 2 * len(thresholds))
+        if threshold_type == "static":
+            dTH = thresholds
+        else:
+            dTH = RecurrenceAnalysis._upper_thresholds(phase_space, block_rows, thresholds, threshold_type, metric)
+
+        error = RecurrenceAnalysis._expansion_error(phase_space, phase_space, metric)
+        recurrence = np.empty((len(dTH), N * (N - 1) // 2), dtype=bool)
+        position = 0
+        for start, stop, block in RecurrenceAnalysis._distance_blocks(phase_space, block_rows, metric=metric, upper=True):
+            upper = RecurrenceAnalysis._exact_recurrence(block, dTH[:, None], phase_space[start:stop], phase_space[start:],
+                                                         error, metric)[:, RecurrenceAnalysis._upper_mask(start, stop, N)]
+            recurrence[:, position:position + upper.shape[1]] = upper
+            position += upper.shape[1]
+            del block, upper
+        return recurrence[0] if np.ndim(threshold) == 0 else recurrence
+
+    @staticmethod
+    def _upper_block_counts(counts, start, stop, recurrence):
+        """
+        把一个已二值化的严格上三角块 (T, rows, N - start) 累加到完整对称矩阵的列计数 (T, N)：
+        行和即镜像到下三角后第 start..stop 列的个数，列和为上三角部分第 start 列之后的个数。
+        """
+        counts[:, start:stop] += np.count_nonzero(recurrence, axis=2)
+        counts[:, start:] += np.count_nonzero(recurrence, axis=1)
+
+    @staticmethod
+    def _condensed_column_counts(condensed, N):
+        """
+        由上三角压缩向量求完整对称矩阵每列 1 的个数：上三角、镜像的下三角与对角线。
+        支持前置的阈值维度 (T, N(N-1)/2)。
+        """
+        condensed = np.atleast_2d(condensed)
+        counts = np.ones((len(condensed), N), dtype=np.int64)
+        block_rows = RecurrenceAnalysis._block_rows(N, RecurrenceAnalysis.DEFAULT_MEMORY_LIMIT_MB,
+                                                    bytes_per_cell=2 * len(condensed))
+        position = 0
+        for start in range(0, N, block_rows):
+            stop = min(start + block_rows, N)
+            upper = RecurrenceAnalysis._upper_mask(start, stop, N)
+            block = np.zeros((len(condensed),) + upper.shape, dtype=bool)
+            block[:, upper] = condensed[:, position:position + np.count_nonzero(upper)]
+            position += np.count_nonzero(upper)
+            RecurrenceAnalysis._upper_block_counts(counts, start, stop, block)
+        return counts
+
+    @staticmethod
+    def calculate_nlid_condensed(condensed_EEG1, condensed_EEG2, N):
+        """
+        基于上三角压缩重建矩阵计算 NLID 指标，列计数已计入镜像的下三角与对角线。
+        :param condensed_EEG1: compute_condensed_recurrence_matrix 的输出
+        :param condensed_EEG2: compute_condensed_recurrence_matrix 的输出
+        :param N: 相空间点数
+        """
+        counts = RecurrenceAnalysis._condensed_counts(condensed_EEG1, condensed_EEG2, N)
+        return RecurrenceAnalysis._nlid_from_counts(*counts)
+
+    @staticmethod
+    def _condensed_counts(condensed_EEG1, condensed_EEG2, N):
+        """
+        压缩布局下 IP、EEG1、EEG2 每列中 1 的个数，支持前置的阈值维度。
+        """
+        column_counts = RecurrenceAnalysis._condensed_column_counts
+        counts = (column_counts(condensed_EEG1 & condensed_EEG2, N).astype(np.float32),
+                  column_counts(condensed_EEG1, N).astype(np.float32),
+                  column_counts(condensed_EEG2, N).astype(np.float32))
+        return tuple(c[0] for c in counts) if condensed_EEG1.ndim == 1 else counts
+
+    @staticmethod
+    def _symmetric_counts(ps_x, ps_y, threshold, threshold_type="dynamic", memory_limit_mb=None, metric="euclidean"):
+        """
+        "symmetric" 引擎：X、Y 同步逐块计算严格上三角的距离，二值化后直接累加行和与列和，
+        得到完整对称矩阵中 IP、EEG1、EEG2 每列 1 的个数 (T, N)，不保存二值化矩阵。
+        动态阈值与重现率先流式扫描上三角确定阈值，同样不保存距离块。
+        """
+        if threshold_type not in ("static", "dynamic", "rr"):
+            raise ValueError("The condensed form supports static, dynamic and rr thresholds only.")
+        N = len(ps_x)
+        thresholds = np.atleast_1d(np.asarray(threshold, dtype=np.float64))
+        block_rows = RecurrenceAnalysis._upper_block_rows(N, memory_limit_mb, bytes_per_cell=32 + 3 * len(thresholds))
+        if threshold_type == "static":
+            dTH_x = dTH_y = thresholds
+        else:
+            dTH_x = RecurrenceAnalysis._upper_thresholds(ps_x, block_rows, thresholds, threshold_type, metric)
+            dTH_y = RecurrenceAnalysis._upper_thresholds(ps_y, block_rows, thresholds, threshold_type, metric)
+
+        # 对角线恒为重现点，每列计 1
+        counts = np.ones((3, len(thresholds), N), dtype=np.int64)
+        blocks = zip(RecurrenceAnalysis._distance_blocks(ps_x, block_rows, metric=metric, upper=True),
+                     RecurrenceAnalysis._distance_blocks(ps_y, block_rows, metric=metric, upper=True))
+        error_x = RecurrenceAnalysis._expansion_error(ps_x, ps_x, metric)
+        error_y = RecurrenceAnalysis._expansion_error(ps_y, ps_y, metric)
+        for (start, stop, block_x), (_, _, block_y) in blocks:
+            upper = RecurrenceAnalysis._upper_mask(start, stop, N)
+            rx = RecurrenceAnalysis._exact_recurrence(block_x, dTH_x[:, None], ps_x[start:stop], ps_x[start:], error_x,
+                                                      metric)
+            ry = RecurrenceAnalysis._exact_recurrence(block_y, dTH_y[:, None], ps_y[start:stop], ps_y[start:], error_y,
+                                                      metric)
+            rx &= upper
+            ry &= upper
+            for k, recurrence in enumerate((rx & ry, rx, ry)):
+                RecurrenceAnalysis._upper_block_counts(counts[k], start, stop, recurrence)
+            del block_x, block_y, rx, ry, recurrence
+        return tuple(c.astype(np.float32) for c in counts)
+
+    @staticmethod
+    def compute_sparse_recurrence_matrix(phase_space, threshold, threshold_type="static", memory_limit_mb=None,
+                                         metric="euclidean"):
+        """
+        以 KD 树近邻搜索直接构建稀疏（CSR）二值化重建矩阵，不计算稠密距离矩阵。
+        适用于静态阈值或低重现率；动态阈值的最小值/最大值仍需一遍分块扫描。
+        :param phase_space: 相空间矩阵
+        :param threshold: 静态或动态的阈值，或阈值序列
         :param threshold_type: "static" 或 "dynamic"
-        :return: 重建矩阵或二值化矩阵
+        :param memory_limit_mb: 动态阈值扫描时的内存预算（MB）
+        :param metric: 距离度量，对应 KD 树的闵可夫斯基 p（见 MINKOWSKI_P）
+        :return: scipy.sparse 布尔矩阵；阈值序列时为矩阵列表
+        """
+        from scipy import sparse
+        from scipy.spatial import cKDTree
+
+        if metric not in RecurrenceAnalysis.METRICS:
+            raise ValueError(f"Unknown metric: {metric}")
+        p = RecurrenceAnalysis.MINKOWSKI_P[metric]
+        N = len(phase_space)
+        thresholds = np.atleast_1d(np.asarray(threshold, dtype=np.float64))
+        if threshold_type == "dynamic":
+            block_rows = RecurrenceAnalysis._block_rows(N, memory_limit_mb or RecurrenceAnalysis.DEFAULT_MEMORY_LIMIT_MB)
+            lo, hi = RecurrenceAnalysis._distance_extrema(phase_space, block_rows, metric=metric)
+            dTH = (hi - lo) * thresholds
+        elif threshold_type == "static":
+            dTH = thresholds
+        else:
+            raise ValueError("The sparse engine supports static and dynamic thresholds only.")
+
+        def pair_distances(i, j):
+            # 稠密引擎复核阈值附近距离时所用的精确公式，逐位一致
+            return RecurrenceAnalysis._direct_distances(phase_space[i], phase_space[j], metric)
+
+        tree = cKDTree(phase_space)
+        diagonal = np.arange(N)
+        # KD 树的距离运算顺序不同，阈值恰好等于某个距离时可能多/少一个点对：
+        # 以略放宽的半径搜索候选点对，再用精确的距离公式复核
+        radius = dTH.max() * (1 + RecurrenceAnalysis.SPARSE_RADIUS_SLACK)
+        matrices = []
+        if len(dTH) == 1:
+            # 只搜索 i < j 的点对，再补上对称的一半与对角线
+            pairs = tree.query_pairs(radius, p=p, output_type="ndarray")
+            pairs = pairs[pair_distances(pairs[:, 0], pairs[:, 1]) <= dTH[0]]
+            rows = np.concatenate([pairs[:, 0], pairs[:, 1], diagonal])
+            cols = np.concatenate([pairs[:, 1], pairs[:, 0], diagonal])
+            matrices.append(sparse.csr_matrix((np.ones(len(rows), dtype=bool), (rows, cols)), shape=(N, N)))
+        else:
+            pairs = tree.sparse_distance_matrix(tree, radius, p=p, output_type="ndarray")
+            distances = pair_distances(pairs["i"], pairs["j"])
+            for value in dTH:
+                selected = pairs[distances <= value]
+                rows = np.concatenate([selected["i"], diagonal])
+                cols = np.concatenate([selected["j"], diagonal])
+                matrix = sparse.csr_matrix((np.ones(len(rows), dtype=bool), (rows, cols)), shape=(N, N))
+                matrices.append(matrix)
+        return matrices[0] if np.ndim(threshold) == 0 else matrices
+
+    @staticmethod
+    def calculate_nlid_sparse(AR_EEG1_BW, AR_EEG2_BW):
+        """
+        基于稀疏重建矩阵计算 NLID 指标，IP 为两者稀疏结构的交集。
+        """
+        return RecurrenceAnalysis._nlid_from_counts(*RecurrenceAnalysis._sparse_column_counts(AR_EEG1_BW, AR_EEG2_BW))
+
+    @staticmethod
+    def _sparse_column_counts(AR_EEG1_BW, AR_EEG2_BW):
+        """
+        稀疏矩阵中 IP、EEG1、EEG2 每列非零元素的个数。
+        """
+        IP = AR_EEG1_BW.multiply(AR_EEG2_BW).tocsr()
+        IP.eliminate_zeros()
+        return (IP.getnnz(axis=0).astype(np.float32),
+                AR_EEG1_BW.getnnz(axis=0).astype(np.float32),
+                AR_EEG2_BW.getnnz(axis=0).astype(np.float32))
+
+    @staticmethod
+    def pack_recurrence_matrix(matrix):
+        """
+        将二值化重建矩阵按列打包为位，内存约为 int64 矩阵的 1/64。
+        :param matrix: 二值化重建矩阵 (N, N)，可带前置的批次维度
+        :return: uint64 矩阵 (N, ceil(N/64))，第 j 行保存第 j 列的位
         """
-        squared_norms = np.sum(phase_space**2, axis=1, keepdims=True)
-        distance_matrix = np.sqrt(
-            np.maximum(0, squared_norms + squared_norms.T - 2 * np.dot(phase_space, phase_space.T))
-        )
+        bits = np.packbits(np.asarray(matrix, dtype=bool).swapaxes(-1, -2), axis=-1)
+        pad = -bits.shape[-1] % 8
+        if pad:
+            bits = np.pad(bits, [(0, 0)] * (bits.ndim - 1) + [(0, pad)])
+        return np.ascontiguousarray(bits).view(np.uint64)
 
-        if threshold_type == "static" and threshold is not None:
-            return (distance_matrix <= threshold).astype(int)
-        elif threshold_type == "dynamic" and threshold is not None:
-            dTH = (np.max(distance_matrix) - np.min(distance_matrix)) * threshold
-            return (distance_matrix <= dTH).astype(int)
+    @staticmethod
+    def unpack_recurrence_matrix(packed_matrix, N):
+        """
+        将 pack_recurrence_matrix 的输出还原为布尔矩阵 (N, N)。
+        """
+        bits = np.unpackbits(np.ascontiguousarray(packed_matrix).view(np.uint8), axis=-1, count=N)
+        return bits.astype(bool).swapaxes(-1, -2)
+
+    @staticmethod
+    def _popcount(words):
+        """
+        统计打包位矩阵每一行（即原矩阵每一列）中 1 的个数。
+        """
+        if hasattr(np, "bitwise_count"):
+            return np.bitwise_count(words).sum(axis=-1, dtype=np.int64)
+        return _POPCOUNT_TABLE[words.view(np.uint8)].sum(axis=-1, dtype=np.int64)
+
+    @staticmethod
+    def _pool_blocks(matrix, factor, reduce):
+        """
+        将二维矩阵按 factor × factor 分块做最大值或平均值池化，末尾不足一块的部分单独成块。
+        """
+        rows = np.arange(0, matrix.shape[0], factor)
+        cols = np.arange(0, matrix.shape[1], factor)
+        if reduce == "max":
+            return np.maximum.reduceat(np.maximum.reduceat(matrix, rows, axis=0), cols, axis=1)
+        sums = np.add.reduceat(np.add.reduceat(matrix, rows, axis=0, dtype=np.float64), cols, axis=1)
+        sizes = np.diff(np.append(rows, matrix.shape[0]))[:, None] * np.diff(np.append(cols, matrix.shape[1]))[None, :]
+        return sums / sizes
 
-        return distance_matrix
+    @staticmethod
+    def downsample_recurrence_matrix(matrix, max_size=None, reduce="max", n_rows=None):
+        """
+        将重现图分块池化到最大边长不超过 max_size，用于绘图。
+        打包位矩阵按列分批解包，不会构建完整的稠密矩阵。
+        :param matrix: 重建矩阵 (N, M)，或打包位矩阵 (M, words)（需给定 n_rows）
+        :param max_size: 池化后的最大边长，默认 MAX_PLOT_SIZE
+        :param reduce: "max"（保留孤立的重现点）或 "mean"（局部重现率）
+        :param n_rows: 打包位矩阵的原始行数 N
+        :return: (池化后的矩阵, 池化倍数)
+        """
+        if reduce not in ("max", "mean"):
+            raise ValueError(f"Unknown reduce: {reduce}")
+        max_size = max_size or RecurrenceAnalysis.MAX_PLOT_SIZE
+        packed = matrix.dtype == np.uint64
+        N, M = (n_rows, len(matrix)) if packed else matrix.shape
+        factor = max(1, -(-max(N, M) // max_size))
+        if not packed:
+            if factor == 1:
+                return matrix, 1
+            return RecurrenceAnalysis._pool_blocks(matrix, factor, reduce), factor
 
+        # 每批解包 factor 的整数倍列，约占 BATCH_CACHE_BYTES 的若干倍
+        batch = factor * max(1, 4 * RecurrenceAnalysis.BATCH_CACHE_BYTES // (N * factor))
+        pooled = []
+        for start in range(0, M, batch):
+            columns = RecurrenceAnalysis.unpack_recurrence_matrix(matrix[start:start + batch], N)
+            pooled.append(RecurrenceAnalysis._pool_blocks(columns, factor, reduce) if factor > 1 else columns)
+        return np.concatenate(pooled, axis=1), factor
 
     @staticmethod
-    def visualize_recurrence_plot(matrix, title, xlabel, ylabel):
+    def visualize_recurrence_plot(matrix, title, xlabel, ylabel, max_size=None, reduce="max", n_rows=None):
         """
-        可视化重现图。
+        可视化重现图。超过 max_size 的矩阵先分块池化再绘制，坐标轴仍为原始索引。
+        :param matrix: 重建矩阵，或打包位矩阵（需给定 n_rows，可直接来自分块计算的 packed 输出）
+        :param max_size: 绘制的最大边长，默认 MAX_PLOT_SIZE
+        :param reduce: 池化方式，"max" 或 "mean"
+        :param n_rows: 打包位矩阵的原始行数
         """
+        # 只在绘图时才导入 matplotlib，批次分析（以及打包后的 NLID.exe）启动时不必载入
+        import matplotlib.pyplot as plt
+
         plt.figure(figsize=(10, 10))
-        plt.imshow(matrix, cmap='gray_r', origin='lower')
+        image, factor = RecurrenceAnalysis.downsample_recurrence_matrix(matrix, max_size, reduce, n_rows)
+        if factor == 1 and matrix.dtype != np.uint64:
+            plt.imshow(matrix, cmap='gray_r', origin='lower')
+        else:
+            N, M = (n_rows, len(matrix)) if matrix.dtype == np.uint64 else matrix.shape
+            plt.imshow(image, cmap='gray_r', origin='lower', interpolation='nearest', extent=(0, M, 0, N))
         plt.title(title, fontsize=14)
         plt.xlabel(xlabel, fontsize=12)
         plt.ylabel(ylabel, fontsize=12)
@@ -66,24 +1064,633 @@ class RecurrenceAnalysis:
         """
         计算 NLID 指标。
         """
-        N = AR_EEG1_BW.shape[1]
-
-        # 初始化为浮点数组
-        NLID_YX = np.zeros(N, dtype=np.float32)
-        NLID_XY = np.zeros(N, dtype=np.float32)
-
         # 批量矩阵操作
         IP = AR_EEG1_BW * AR_EEG2_BW
         number_of_1 = np.sum(IP, axis=0, dtype=np.float32)
         number_of_EEG1 = np.sum(AR_EEG1_BW, axis=0, dtype=np.float32)
         number_of_EEG2 = np.sum(AR_EEG2_BW, axis=0, dtype=np.float32)
 
+        return RecurrenceAnalysis._nlid_from_counts(number_of_1, number_of_EEG1, number_of_EEG2)
+
+    @staticmethod
+    def calculate_nlid_packed(packed_EEG1, packed_EEG2):
+        """
+        基于打包位矩阵计算 NLID 指标，以按位与 + popcount 代替逐元素乘法。
+        :param packed_EEG1: pack_recurrence_matrix 的输出
+        :param packed_EEG2: pack_recurrence_matrix 的输出
+        """
+        number_of_1 = RecurrenceAnalysis._popcount(packed_EEG1 & packed_EEG2).astype(np.float32)
+        number_of_EEG1 = RecurrenceAnalysis._popcount(packed_EEG1).astype(np.float32)
+        number_of_EEG2 = RecurrenceAnalysis._popcount(packed_EEG2).astype(np.float32)
+
+        return RecurrenceAnalysis._nlid_from_counts(number_of_1, number_of_EEG1, number_of_EEG2)
+
+    @staticmethod
+    def _column_counts(AR_EEG1_BW, AR_EEG2_BW):
+        """
+        计算 IP、EEG1、EEG2 每列中 1 的个数，支持批量布尔矩阵 (B, N, N)
+        或批量打包位矩阵 (B, N, words)。
+        """
+        if AR_EEG1_BW.dtype == np.uint64:
+            popcount = RecurrenceAnalysis._popcount
+            return (popcount(AR_EEG1_BW & AR_EEG2_BW).astype(np.float32),
+                    popcount(AR_EEG1_BW).astype(np.float32),
+                    popcount(AR_EEG2_BW).astype(np.float32))
+        return (np.sum(AR_EEG1_BW & AR_EEG2_BW, axis=-2, dtype=np.float32),
+                np.sum(AR_EEG1_BW, axis=-2, dtype=np.float32),
+                np.sum(AR_EEG2_BW, axis=-2, dtype=np.float32))
+
+    @staticmethod
+    def _batched_distances(windows, others=None, metric="euclidean"):
+        """
+        批量计算多个窗口的距离矩阵。
+        :param windows: 窗口相空间 (B, W, m)
+        :param others: 另一组窗口相空间 (B, W, m)，给定时计算交叉距离
+        :param metric: 距离度量，见 compute_reconstruction_matrix
+        :return: 距离矩阵 (B, W, W)
+        """
+        return RecurrenceAnalysis._pairwise_distances(windows, windows if others is None else others, metric)
+
+    @staticmethod
+    def _batched_recurrence(windows, threshold, threshold_type, others=None, metric="euclidean"):
+        """
+        批量计算多个窗口的二值化重建矩阵 (B, T, W, W)，给定 others 时为交叉重建矩阵。
+        距离以范数展开批量计算，阈值与比较结果按精确距离确定（见 _exact_thresholds、_exact_less_equal），
+        与融合核、稀疏引擎逐位一致。
+        """
+        columns = windows if others is None else others
+        distances = RecurrenceAnalysis._batched_distances(windows, others, metric)
+        error = RecurrenceAnalysis._expansion_error(windows, columns, metric)
+        dTH = RecurrenceAnalysis._exact_thresholds(distances, windows, columns, threshold, threshold_type, error, metric,
+                                                   self_distances=others is None)
+        return RecurrenceAnalysis._exact_recurrence(distances, dTH, windows, columns, error, metric)
+
+    @staticmethod
+    def _window_layout(n, m, tau, window, step):
+        """
+        长度为 n 的记录按滑动窗口分析时，每个窗口的相空间点数与各窗口的起点。
+        """
+        window_points = window - (m - 1) * tau
+        if window_points <= 0:
+            raise ValueError("Window is shorter than the embedding span (m - 1) * tau.")
+        return window_points, np.arange(0, n - window + 1, step)
+
+    @staticmethod
+    def _batch_size(window_points, n_thresholds, memory_limit_mb):
+        """
+        批量计算每批的窗口数。每个窗口的稠密矩阵（距离、临时数组与各阈值的布尔矩阵）约 W²·(17+T) 字节，
+        每批控制在内存预算内，且距离矩阵不超过 BATCH_CACHE_BYTES（过大的批次反而更慢）。
+        单个窗口已超出预算时返回 0。
+        """
+        memory_limit_mb = memory_limit_mb or RecurrenceAnalysis.DEFAULT_MEMORY_LIMIT_MB
+        fit = int(memory_limit_mb * 2**20 // (window_points**2 * (17 + n_thresholds)))
+        return min(fit, max(1, RecurrenceAnalysis.BATCH_CACHE_BYTES // (window_points**2 * 8)))
+
+    @staticmethod
+    def _window_engine(engine, window_points, n_thresholds, memory_limit_mb):
+        """
+        单个窗口的稠密矩阵已超出内存预算时（未给定时为 DEFAULT_MEMORY_LIMIT_MB，见 _batch_size），
+        "batched" 与 "incremental" 改用逐块计算的 "tiled"。
+        """
+        if (engine in ("batched", "incremental")
+                and RecurrenceAnalysis._batch_size(window_points, n_thresholds, memory_limit_mb) == 0):
+            return "tiled"
+        return engine
+
+    @staticmethod
+    def _recurrence_chunks(phase_space, starts, window_points, threshold, threshold_type, engine, memory_limit_mb,
+                           metric="euclidean"):
+        """
+        依次产生各窗口的二值化重建矩阵，每次一批 (B, T, W, W)，T 为阈值个数；
+        "tiled" 引擎产生打包位矩阵 (1, T, W, words)。
+        :param phase_space: 整段记录的相空间矩阵
+        :param starts: 各窗口的起点
+        :param window_points: 每个窗口的相空间点数
+        :param engine: "batched"、"incremental" 或 "tiled"
+        """
+        engine = RecurrenceAnalysis._window_engine(engine, window_points, np.size(threshold), memory_limit_mb)
+        memory_limit_mb = memory_limit_mb or RecurrenceAnalysis.DEFAULT_MEMORY_LIMIT_MB
+        if engine == "batched":
+            # 所有窗口都是整段相空间的跨步视图，不复制数据
+            views = np.lib.stride_tricks.sliding_window_view(phase_space, window_points, axis=0)
+            views = views.transpose(0, 2, 1)
+            chunk = max(1, RecurrenceAnalysis._batch_size(window_points, np.size(threshold), memory_limit_mb))
+            for i in range(0, len(starts), chunk):
+                yield RecurrenceAnalysis._batched_recurrence(views[starts[i:i + chunk]], threshold, threshold_type,
+                                                             metric=metric)
+        elif engine == "incremental":
+            step = starts[1] - starts[0] if len(starts) > 1 else window_points
+            incremental = IncrementalRecurrence(phase_space, window_points, step, metric)
+            for start in starts:
+                yield incremental.advance(start).recurrence_matrix(np.atleast_1d(threshold), threshold_type)[None]
+        elif engine == "tiled":
+            for start in starts:
+                yield RecurrenceAnalysis.compute_reconstruction_matrix(
+                    phase_space[start:start + window_points], np.atleast_1d(threshold), threshold_type,
+                    memory_limit_mb=memory_limit_mb, packed=True, metric=metric)[None]
+        else:
+            raise ValueError(f"Unknown engine: {engine}")
+
+    @staticmethod
+    def _cross_recurrence_rates(ps_x, ps_y, starts, window_points, threshold, threshold_type, engine, memory_limit_mb,
+                                metric="euclidean"):
+        """
+        依次产生各窗口交叉重建矩阵的重现率，每次一批 (B, T)。
+        "tiled" 引擎逐窗口分块计算打包位矩阵，其余引擎使用批量矩阵运算。
+        """
+        if threshold_type not in ("static", "dynamic", "rr"):
+            raise ValueError("Cross recurrence supports static, dynamic and rr thresholds only.")
+        engine = RecurrenceAnalysis._window_engine(engine, window_points, np.size(threshold), memory_limit_mb)
+        memory_limit_mb = memory_limit_mb or RecurrenceAnalysis.DEFAULT_MEMORY_LIMIT_MB
+        if engine == "tiled":
+            for start in starts:
+                CR = RecurrenceAnalysis.compute_cross_recurrence_matrix(
+                    ps_x[start:start + window_points], ps_y[start:start + window_points], np.atleast_1d(threshold),
+                    threshold_type, memory_limit_mb, packed=True, metric=metric)
+                yield RecurrenceAnalysis.recurrence_rate(CR, window_points)[None]
+            return
+        views_x = np.lib.stride_tricks.sliding_window_view(ps_x, window_points, axis=0).transpose(0, 2, 1)
+        views_y = np.lib.stride_tricks.sliding_window_view(ps_y, window_points, axis=0).transpose(0, 2, 1)
+        chunk = max(1, RecurrenceAnalysis._batch_size(window_points, np.size(threshold), memory_limit_mb))
+        for i in range(0, len(starts), chunk):
+            window_starts = starts[i:i + chunk]
+            CR = RecurrenceAnalysis._batched_recurrence(views_x[window_starts], threshold, threshold_type,
+                                                        views_y[window_starts], metric)
+            yield np.count_nonzero(CR, axis=(-2, -1)) / window_points**2
+
+    @staticmethod
+    def nlid_windows(x, y, m, tau, window, step, threshold=0.1, threshold_type="dynamic", engine="batched",
+                     memory_limit_mb=None, metric="euclidean"):
+        """
+        对两条时间序列按滑动窗口批量计算 NLID。
+        :param x: 时间序列 X，或多通道序列 (L, C)（联合嵌入，见 embed）
+        :param y: 时间序列 Y，或多通道序列 (L, C)
+        :param m: 嵌入维度（每个通道）
+        :param tau: 时间延迟
+        :param window: 窗口长度（样本数）
+        :param step: 窗口步长
+        :param threshold: 静态或动态的阈值、重现率或近邻个数；给定阈值序列时为阈值扫描，每个窗口只计算一次距离
+        :param threshold_type: "static"、"dynamic"、"rr"（固定重现率）或 "knn"（每列固定近邻个数）
+        :param engine: "batched"（批量矩阵运算）、"incremental"（增量更新）、"tiled"（分块）
+                       "sparse"（KD 树稀疏矩阵）、"fused"（融合核，不保存 N×N 矩阵），后两者仅支持静态/动态阈值；
+                       或 "symmetric"（只计算上三角，不支持 "knn"）
+        :param memory_limit_mb: 每批/每块的内存预算（MB），None 时为 DEFAULT_MEMORY_LIMIT_MB；
+                                单个窗口已超出预算时 "batched"、"incremental" 改用 "tiled"
+        :param metric: 距离度量，"euclidean"、"chebyshev" 或 "manhattan"，所有引擎均支持
+        :return: 每个窗口的 NLID(X|Y) 与 NLID(Y|X) 数组；阈值扫描时为 (窗口数, 阈值数) 的表
+        """
+        n = min(len(x), len(y))
+        window_points, starts = RecurrenceAnalysis._window_layout(n, m, tau, window, step)
+        ps_x = RecurrenceAnalysis.embed(x[:n], m, tau)
+        ps_y = RecurrenceAnalysis.embed(y[:n], m, tau)
+
+        nlid_xy, nlid_yx = [], []
+        if engine == "sparse":
+            for start in starts:
+                AR_X = RecurrenceAnalysis.compute_sparse_recurrence_matrix(
+                    ps_x[start:start + window_points], np.atleast_1d(threshold), threshold_type, memory_limit_mb, metric)
+                AR_Y = RecurrenceAnalysis.compute_sparse_recurrence_matrix(
+                    ps_y[start:start + window_points], np.atleast_1d(threshold), threshold_type, memory_limit_mb, metric)
+                counts = [RecurrenceAnalysis._sparse_column_counts(a, b) for a, b in zip(AR_X, AR_Y)]
+                xy, yx = RecurrenceAnalysis._nlid_from_counts(*(np.stack(c)[None] for c in zip(*counts)))
+                nlid_xy.append(xy)
+                nlid_yx.append(yx)
+        elif engine == "fused":
+            for start in starts:
+                xy, yx = RecurrenceAnalysis.calculate_nlid_fused(
+                    ps_x[start:start + window_points], ps_y[start:start + window_points],
+                    np.atleast_1d(threshold), threshold_type, memory_limit_mb, metric=metric)
+                nlid_xy.append(xy[None])
+                nlid_yx.append(yx[None])
+        elif engine == "symmetric":
+            for start in starts:
+                counts = RecurrenceAnalysis._symmetric_counts(
+                    ps_x[start:start + window_points], ps_y[start:start + window_points], threshold, threshold_type,
+                    memory_limit_mb, metric)
+                xy, yx = RecurrenceAnalysis._nlid_from_counts(*(c[None] for c in counts))
+                nlid_xy.append(xy)
+                nlid_yx.append(yx)
+        else:
+            chunks = zip(
+                RecurrenceAnalysis._recurrence_chunks(ps_x, starts, window_points, threshold, threshold_type, engine, memory_limit_mb, metric),
+                RecurrenceAnalysis._recurrence_chunks(ps_y, starts, window_points, threshold, threshold_type, engine, memory_limit_mb, metric))
+            for AR_X, AR_Y in chunks:
+                xy, yx = RecurrenceAnalysis._nlid_from_counts(*RecurrenceAnalysis._column_counts(AR_X, AR_Y))
+                nlid_xy.append(xy)
+                nlid_yx.append(yx)
+                # 先释放本批矩阵再计算下一批
+                del AR_X, AR_Y
+
+        if not nlid_xy:
+            empty = np.empty((0, np.size(threshold)), dtype=np.float32)
+            nlid_xy, nlid_yx = [empty], [empty]
+        nlid_xy, nlid_yx = np.concatenate(nlid_xy), np.concatenate(nlid_yx)
+        if np.ndim(threshold) == 0:
+            return nlid_xy[:, 0], nlid_yx[:, 0]
+        return nlid_xy, nlid_yx
+
+    @staticmethod
+    def analyze_windows(x, y, m, tau, window, step, threshold=0.1, threshold_type="dynamic", engine="batched",
+                        memory_limit_mb=None, rqa=True, lmin=2, vmin=2, cross=False, metric="euclidean"):
+        """
+        按滑动窗口同时计算 NLID 与其他基于同一重建矩阵的指标，每个窗口的距离只计算一次。
+        :param engine: "batched"、"incremental" 或 "tiled"
+        :param rqa: 是否计算 X、Y 的 RQA 指标（见 RQA.RQAMeasures）
+        :param lmin: 对角线的最短长度
+        :param vmin: 垂直线的最短长度
+        :param cross: 是否计算交叉重现率（CRR）与联合重现率（JRR），不支持 "knn"；
+                      X、Y 量纲可能不同，CRR 在整段记录逐通道 z 标准化后的相空间上计算（静态阈值以标准差为单位）
+        其余参数同 nlid_windows
+        :return: 字典，"start" 为各窗口起点（样本），"nlid_xy"、"nlid_yx" 同 nlid_windows；
+                 rqa 为 True 时另有 "rqa_x"、"rqa_y"，形状 (窗口数, [阈值数,] 指标数)；
+                 cross 为 True 时另有 "crr"、"jrr"，形状同 "nlid_xy"
+        """
+        from RQA import RQAMeasures
+
+        if engine not in ("batched", "incremental", "tiled"):
+            raise ValueError(f"Engine {engine} does not produce recurrence matrices for analyze_windows.")
+        n = min(len(x), len(y))
+        window_points, starts = RecurrenceAnalysis._window_layout(n, m, tau, window, step)
+        ps_x = RecurrenceAnalysis.embed(x[:n], m, tau)
+        ps_y = RecurrenceAnalysis.embed(y[:n], m, tau)
+        T = np.size(threshold)
+        n_measures = len(RQAMeasures.MEASURES)
+
+        results = {"nlid_xy": [], "nlid_yx": [], "rqa_x": [], "rqa_y": [], "crr": [], "jrr": []}
+        chunks = zip(
+            RecurrenceAnalysis._recurrence_chunks(ps_x, starts, window_points, threshold, threshold_type, engine, memory_limit_mb, metric),
+            RecurrenceAnalysis._recurrence_chunks(ps_y, starts, window_points, threshold, threshold_type, engine, memory_limit_mb, metric))
+        for AR_X, AR_Y in chunks:
+            counts = RecurrenceAnalysis._column_counts(AR_X, AR_Y)
+            xy, yx = RecurrenceAnalysis._nlid_from_counts(*counts)
+            results["nlid_xy"].append(xy)
+            results["nlid_yx"].append(yx)
+            if cross:
+                # 联合重建矩阵即 NLID 计数中的 IP，无需另行计算
+                results["jrr"].append(counts[0].sum(axis=-1, dtype=np.float64) / window_points**2)
+            if rqa:
+                for key, AR in (("rqa_x", AR_X), ("rqa_y", AR_Y)):
+                    values = [[RQAMeasures.compute_array(matrix, lmin, vmin) for matrix in per_window] for per_window in AR]
+                    results[key].append(np.array(values).reshape(len(AR), T, n_measures))
+                del AR
+            del AR_X, AR_Y
+        if cross:
+            if ps_x.shape[1] != ps_y.shape[1]:
+                raise ValueError("Cross recurrence needs X and Y embeddings of the same dimension.")
+            # 交叉距离混合了 X、Y 的坐标，须先统一量纲，否则幅值大的一方使 CRR 恒为 0
+            cross_x = RecurrenceAnalysis.embed(RecurrenceAnalysis._standardize(x[:n]), m, tau)
+            cross_y = RecurrenceAnalysis.embed(RecurrenceAnalysis._standardize(y[:n]), m, tau)
+            results["crr"] = list(RecurrenceAnalysis._cross_recurrence_rates(
+                cross_x, cross_y, starts, window_points, threshold, threshold_type, engine, memory_limit_mb, metric))
+
+        shapes = {"nlid_xy": (0, T), "nlid_yx": (0, T), "rqa_x": (0, T, n_measures), "rqa_y": (0, T, n_measures),
+                  "crr": (0, T), "jrr": (0, T)}
+        output = {"start": starts}
+        for key, parts in results.items():
+            if (key.startswith("rqa") and not rqa) or (key in ("crr", "jrr") and not cross):
+                continue
+            values = np.concatenate(parts) if parts else np.empty(shapes[key])
+            output[key] = values[:, 0] if np.ndim(threshold) == 0 else values
+        return output
+
+    @staticmethod
+    def phase_randomized_surrogates(data, n_surrogates, rng=None):
+        """
+        批量生成相位随机化替代数据：保留功率谱，随机化各频率的相位。
+        :param data: 一维时间序列 (L,)
+        :param n_surrogates: 替代序列个数 S
+        :param rng: numpy.random.Generator，None 时新建
+        :return: 替代序列 (S, L)
+        """
+        rng = rng or np.random.default_rng()
+        data = np.asarray(data, dtype=np.float64)
+        L = len(data)
+        spectrum = np.fft.rfft(data)
+        phases = rng.uniform(0, 2 * np.pi, (n_surrogates, len(spectrum)))
+        # 直流与奈奎斯特分量须为实数，保持均值且使逆变换为实序列
+        phases[:, 0] = 0
+        if L % 2 == 0:
+            phases[:, -1] = 0
+        return np.fft.irfft(np.abs(spectrum) * np.exp(1j * phases), n=L, axis=1)
+
+    @staticmethod
+    def iaaft_surrogates(data, n_surrogates, max_iter=None, rng=None):
+        """
+        批量生成 IAAFT 替代数据：交替匹配原序列的幅度谱与数值分布，所有替代序列同时迭代。
+        :param data: 一维时间序列 (L,)
+        :param n_surrogates: 替代序列个数 S
+        :param max_iter: 最大迭代次数，默认 IAAFT_MAX_ITER；排序不再变化时提前结束
+        :param rng: numpy.random.Generator，None 时新建
+        :return: 替代序列 (S, L)，数值分布与原序列完全相同
+        """
+        rng = rng or np.random.default_rng()
+        max_iter = max_iter or RecurrenceAnalysis.IAAFT_MAX_ITER
+        data = np.asarray(data, dtype=np.float64)
+        L = len(data)
+        amplitudes = np.abs(np.fft.rfft(data))
+        sorted_values = np.sort(data)
+
+        surrogates = rng.permuted(np.broadcast_to(data, (n_surrogates, L)), axis=1)
+        ranks = None
+        for _ in range(max_iter):
+            spectrum = np.fft.rfft(surrogates, axis=1)
+            matched = np.fft.irfft(amplitudes * np.exp(1j * np.angle(spectrum)), n=L, axis=1)
+            new_ranks = np.argsort(np.argsort(matched, axis=1), axis=1)
+            surrogates = sorted_values[new_ranks]
+            if ranks is not None and np.array_equal(ranks, new_ranks):
+                break
+            ranks = new_ranks
+        return surrogates
+
+    @staticmethod
+    def nlid_surrogate_test(x, y, m, tau, window, step, threshold=0.1, threshold_type="dynamic", n_surrogates=100,
+                            method="phase", memory_limit_mb=None, rng=None, metric="euclidean", engine="batched"):
+        """
+        以 Y 的替代数据检验 NLID 的显著性。每个窗口的 AR_X 只计算一次，观测 NLID 与替代序列都与它计数；
+        替代序列成批生成、嵌入并计算重建矩阵。
+        p 值为 (1 + 替代 NLID >= 观测 NLID 的个数) / (S + 1)。
+        :param n_surrogates: 每个窗口的替代序列个数 S
+        :param method: "phase"（相位随机化）或 "iaaft"
+        :param rng: numpy.random.Generator，None 时新建
+        :param engine: 引擎，见 nlid_windows；观测 NLID 与替代序列共用同一批重建矩阵，
+                       "tiled" 或单个窗口超出内存预算时逐块计算，否则批量计算
+        其余参数同 nlid_windows
+        :return: 字典，"start"、"nlid_xy"、"nlid_yx" 同 analyze_windows；
+                 "p_xy"、"p_yx" 为每个窗口的 p 值，形状同 "nlid_xy"；
+                 "p_file_xy"、"p_file_yx" 为以窗口平均 NLID 计算的整段记录 p 值（阈值扫描时为 (阈值数,)）
+        """
+        if method not in RecurrenceAnalysis.SURROGATE_METHODS:
+            raise ValueError(f"Unknown surrogate method: {method}")
+        if np.ndim(y) != 1:
+            raise ValueError("Surrogate testing needs a univariate Y.")
+        rng = rng or np.random.default_rng()
+        generate = (RecurrenceAnalysis.phase_randomized_surrogates if method == "phase"
+                    else RecurrenceAnalysis.iaaft_surrogates)
+        n = min(len(x), len(y))
+        window_points, starts = RecurrenceAnalysis._window_layout(n, m, tau, window, step)
+        y = np.asarray(y[:n], dtype=np.float64)
+        T = np.size(threshold)
+        thresholds = np.atleast_1d(threshold)
+
+        if engine in ("sparse", "fused") and threshold_type not in ("static", "dynamic"):
+            raise ValueError(f"The {engine} engine supports static and dynamic thresholds only.")
+        if engine == "symmetric" and threshold_type == "knn":
+            raise ValueError("The symmetric engine does not support knn thresholds.")
+        # 替代序列与 AR_X 计数需要重建矩阵：不产生矩阵的引擎改用批量计算（各引擎结果逐位一致），
+        # 单个窗口超出预算时逐块计算并打包
+        matrix_engine = "batched" if engine in ("sparse", "fused", "symmetric") else engine
+        matrix_engine = RecurrenceAnalysis._window_engine(matrix_engine, window_points, T, memory_limit_mb)
+        chunk = max(1, RecurrenceAnalysis._batch_size(window_points, T, memory_limit_mb))
+        # 观测 NLID 与替代序列共用同一批 AR_X，每个窗口的 AR_X 只计算一次
+        chunks = zip(
+            RecurrenceAnalysis._recurrence_chunks(RecurrenceAnalysis.embed(x[:n], m, tau), starts, window_points,
+                                                  thresholds, threshold_type, matrix_engine, memory_limit_mb, metric),
+            RecurrenceAnalysis._recurrence_chunks(RecurrenceAnalysis.embed(y, m, tau), starts, window_points,
+                                                  thresholds, threshold_type, matrix_engine, memory_limit_mb, metric))
+
+        observed = np.empty((2, len(starts), T), dtype=np.float32)
+        exceed = np.zeros((2, len(starts), T), dtype=np.int64)
+        null_sum = np.zeros((2, n_surrogates, T), dtype=np.float64)
+        w = 0
+        for AR_X_batch, AR_Y_batch in chunks:
+            counts = RecurrenceAnalysis._column_counts(AR_X_batch, AR_Y_batch)
+            observed[:, w:w + len(AR_X_batch)] = RecurrenceAnalysis._nlid_from_counts(*counts)
+            del AR_Y_batch, counts
+            for AR_X in AR_X_batch:
+                start = starts[w]
+                surrogates = generate(y[start:start + window], n_surrogates, rng=rng)
+                # 替代序列 (S, window) 直接以跨步视图嵌入为 (S, W, m)
+                embedded = np.lib.stride_tricks.sliding_window_view(surrogates, (m - 1) * tau + 1, axis=1)[:, :, ::tau]
+                for i in range(0, n_surrogates, chunk):
+                    if matrix_engine == "tiled":
+                        AR_S = np.stack([RecurrenceAnalysis.compute_reconstruction_matrix(
+                            surrogate, thresholds, threshold_type, packed=True, metric=metric,
+                            memory_limit_mb=memory_limit_mb or RecurrenceAnalysis.DEFAULT_MEMORY_LIMIT_MB)
+                            for surrogate in embedded[i:i + chunk]])
+                    else:
+                        AR_S = RecurrenceAnalysis._batched_recurrence(embedded[i:i + chunk], thresholds,
+                                                                      threshold_type, metric=metric)
+                    null = np.array(RecurrenceAnalysis._nlid_from_counts(
+                        *RecurrenceAnalysis._column_counts(AR_X[None], AR_S)))
+                    exceed[:, w] += np.count_nonzero(null >= observed[:, w, None], axis=1)
+                    null_sum[:, i:i + len(AR_S)] += null
+                w += 1
+            del AR_X_batch
+
+        p_window = (1 + exceed) / (n_surrogates + 1)
+        if len(starts):
+            null_mean = null_sum / len(starts)
+            p_file = (1 + np.count_nonzero(null_mean >= observed.mean(axis=1)[:, None], axis=1)) / (n_surrogates + 1)
+        else:
+            p_file = np.full((2, T), np.nan)
+        output = {"start": starts, "nlid_xy": observed[0], "nlid_yx": observed[1], "p_xy": p_window[0],
+                  "p_yx": p_window[1], "p_file_xy": p_file[0], "p_file_yx": p_file[1]}
+        if np.ndim(threshold) == 0:
+            output = {key: value if key == "start" else value[..., 0] for key, value in output.items()}
+        return output
+
+    @staticmethod
+    def calculate_nlid_fused(ps_x, ps_y, threshold=0.1, threshold_type="dynamic", memory_limit_mb=None, use_numba=True,
+                             metric="euclidean"):
+        """
+        融合计算距离、阈值化与 NLID 计数，不保存任何 N×N 矩阵。
+        安装 numba 时使用编译核，否则使用分块的 NumPy 版本，两者结果相同。
+        :param ps_x: X 的相空间矩阵
+        :param ps_y: Y 的相空间矩阵
+        :param threshold: 静态或动态的阈值，或阈值序列
+        :param threshold_type: "static" 或 "dynamic"
+        :param memory_limit_mb: NumPy 版本的分块内存预算（MB）
+        :param use_numba: 是否在可用时使用 numba 编译核
+        :param metric: 距离度量，见 compute_reconstruction_matrix
+        :return: NLID(X|Y) 与 NLID(Y|X)；阈值序列时为数组
+        """
+        if threshold_type not in ("static", "dynamic"):
+            raise ValueError("The fused kernel supports static and dynamic thresholds only.")
+        if metric not in RecurrenceAnalysis.METRICS:
+            raise ValueError(f"Unknown metric: {metric}")
+        metric_code = RecurrenceAnalysis.METRICS.index(metric)
+        ps_x = np.ascontiguousarray(ps_x, dtype=np.float64)
+        ps_y = np.ascontiguousarray(ps_y, dtype=np.float64)
+        N = len(ps_x)
+        thresholds = np.atleast_1d(np.asarray(threshold, dtype=np.float64))
+        kernels = _fused_kernels() if use_numba else None
+        compiled = kernels is not None
+        block_rows = RecurrenceAnalysis._block_rows(N, memory_limit_mb or RecurrenceAnalysis.DEFAULT_MEMORY_LIMIT_MB,
+                                                    bytes_per_cell=32 + 3 * len(thresholds))
+
+        if threshold_type == "dynamic":
+            dTH = []
+            for ps in (ps_x, ps_y):
+                if compiled:
+                    lo, hi = kernels[0](ps, metric_code)
+                else:
+                    lo, hi = RecurrenceAnalysis._distance_extrema(ps, block_rows, metric=metric)
+                dTH.append((hi - lo) * thresholds)
+            dTH_x, dTH_y = dTH
+        else:
+            dTH_x = dTH_y = thresholds
+
+        if compiled:
+            joint, count_x, count_y = kernels[1](ps_x, ps_y, dTH_x, dTH_y, metric_code)
+        else:
+            joint = np.zeros((len(thresholds), N), dtype=np.int64)
+            count_x = np.zeros((len(thresholds), N), dtype=np.int64)
+            count_y = np.zeros((len(thresholds), N), dtype=np.int64)
+            error_x = RecurrenceAnalysis._expansion_error(ps_x, ps_x, metric)
+            error_y = RecurrenceAnalysis._expansion_error(ps_y, ps_y, metric)
+            blocks = zip(RecurrenceAnalysis._distance_blocks(ps_x, block_rows, metric=metric),
+                         RecurrenceAnalysis._distance_blocks(ps_y, block_rows, metric=metric))
+            for (start, stop, block_x), (_, _, block_y) in blocks:
+                rx = RecurrenceAnalysis._exact_recurrence(block_x, dTH_x[:, None], ps_x[start:stop], ps_x, error_x, metric)
+                ry = RecurrenceAnalysis._exact_recurrence(block_y, dTH_y[:, None], ps_y[start:stop], ps_y, error_y, metric)
+                joint += np.count_nonzero(rx & ry, axis=1)
+                count_x += np.count_nonzero(rx, axis=1)
+                count_y += np.count_nonzero(ry, axis=1)
+                del block_x, block_y, rx, ry
+
+        nlid_xy, nlid_yx = RecurrenceAnalysis._nlid_from_counts(
+            joint.astype(np.float32), count_x.astype(np.float32), count_y.astype(np.float32))
+        if np.ndim(threshold) == 0:
+            return nlid_xy[0], nlid_yx[0]
+        return nlid_xy, nlid_yx
+
+    @staticmethod
+    def nlid_matrix_windows(channels, m, tau, window, step, threshold=0.1, threshold_type="dynamic", engine="batched",
+                            memory_limit_mb=None, metric="euclidean"):
+        """
+        多通道两两 NLID。每个通道在每个窗口的重建矩阵只计算一次并打包为位，
+        所有通道对都由这些缓存的矩阵计数，嵌入与距离计算为 O(K) 而非 O(K²)。
+        :param channels: K 条时间序列的列表
+        :param engine: "batched"、"incremental" 或 "tiled"
+        其余参数同 nlid_windows
+        :return: 每个窗口的 K×K 方向性 NLID 矩阵 (窗口数, K, K)，[k, l] 为 NLID(k|l)；
+                 阈值扫描时为 (窗口数, 阈值数, K, K)
+        """
+        if engine not in ("batched", "incremental", "tiled"):
+            raise ValueError(f"Engine {engine} is not supported for multi-channel NLID.")
+        K = len(channels)
+        n = min(len(c) for c in channels)
+        window_points, starts = RecurrenceAnalysis._window_layout(n, m, tau, window, step)
+
+        generators = [
+            RecurrenceAnalysis._recurrence_chunks(RecurrenceAnalysis.embed(c[:n], m, tau), starts, window_points,
+                                                  threshold, threshold_type, engine, memory_limit_mb, metric)
+            for c in channels]
+        matrices = []
+        for chunk in zip(*generators):
+            packed = [AR if AR.dtype == np.uint64 else RecurrenceAnalysis.pack_recurrence_matrix(AR) for AR in chunk]
+            counts = [RecurrenceAnalysis._popcount(P).astype(np.float32) for P in packed]
+            nlid = np.empty(chunk[0].shape[:2] + (K, K), dtype=np.float32)
+            for k in range(K):
+                nlid[..., k, k] = RecurrenceAnalysis._nlid_from_counts(counts[k], counts[k], counts[k])[0]
+                for l in range(k + 1, K):
+                    joint = RecurrenceAnalysis._popcount(packed[k] & packed[l]).astype(np.float32)
+                    nlid[..., k, l], nlid[..., l, k] = RecurrenceAnalysis._nlid_from_counts(joint, counts[k], counts[l])
+            matrices.append(nlid)
+            del chunk, packed
+
+        if not matrices:
+            matrices = [np.empty((0, np.size(threshold), K, K), dtype=np.float32)]
+        matrices = np.concatenate(matrices)
+        return matrices[:, 0] if np.ndim(threshold) == 0 else matrices
+
+    @staticmethod
+    def _nlid_from_counts(number_of_1, number_of_EEG1, number_of_EEG2):
+        """
+        由每列的计数求 NLID 平均值，计数可带前置的批次维度 (..., N)。
+        """
+        # 初始化为浮点数组
+        NLID_YX = np.zeros(number_of_1.shape, dtype=np.float32)
+        NLID_XY = np.zeros(number_of_1.shape, dtype=np.float32)
+
         # 避免类型错误，确保输出类型为浮点数
         NLID_YX = np.divide(number_of_1, number_of_EEG1, where=number_of_EEG1 > 0, out=NLID_YX)
         NLID_XY = np.divide(number_of_1, number_of_EEG2, where=number_of_EEG2 > 0, out=NLID_XY)
 
-        NLID_YX_avg = np.mean(NLID_YX)
-        NLID_XY_avg = np.mean(NLID_XY)
+        NLID_YX_avg = np.mean(NLID_YX, axis=-1)
+        NLID_XY_avg = np.mean(NLID_XY, axis=-1)
 
         return NLID_XY_avg, NLID_YX_avg
 
+
+
+class IncrementalRecurrence:
+    def __init__(self, phase_space, window_points, step, metric="euclidean"):
+        """
+        滑动窗口的增量重建矩阵。相邻窗口重叠部分的距离直接沿用，
+        每次只计算新进入窗口的行与列。
+        :param phase_space: 整段记录的相空间矩阵
+        :param window_points: 每个窗口包含的相空间点数
+        :param step: 相邻窗口起点的间隔
+        :param metric: 距离度量，见 RecurrenceAnalysis.compute_reconstruction_matrix
+        """
+        self.phase_space = phase_space
+        self.metric = metric
+        self.window_points = window_points
+        self.step = step
+        # 范数展开距离的误差上界，阈值附近的距离以精确值复核
+        self.error = RecurrenceAnalysis._expansion_error(phase_space, phase_space, metric)
+        # 环形缓冲区：全局第 p 个点存放在第 p % window_points 个槽位
+        self.distance = np.empty((window_points, window_points), dtype=np.float64)
+        # 每个点与其后（含自身）窗口内各点距离的最大值，用于更新动态阈值（最小值恒为对角线的 0）
+        self.forward_max = np.empty(window_points, dtype=np.float64)
+        self.start = None
+
+    def _slots(self, start, stop):
+        return np.arange(start, stop) % self.window_points
+
+    def _distances(self, start, stop, window_start):
+        return RecurrenceAnalysis._pairwise_distances(
+            self.phase_space[start:stop], self.phase_space[window_start:window_start + self.window_points], self.metric)
+
+    def advance(self, start):
+        """
+        将窗口移动到起点 start。与上一个窗口重叠时只计算新点对应的行与列。
+        """
+        W = self.window_points
+        stop = start + W
+        if self.start is None or start <= self.start or start - self.start >= W:
+            new_start = start
+        else:
+            new_start = self.start + W
+        k = stop - new_start
+
+        block = self._distances(new_start, stop, start)
+        new_slots = self._slots(new_start, stop)
+        all_slots = self._slots(start, stop)
+        self.distance[new_slots[:, None], all_slots] = block
+        self.distance[all_slots[:, None], new_slots] = block.T
+
+        # 旧点的向后极值并入与新点的距离
+        if k < W:
+            old_slots = all_slots[:W - k]
+            self.forward_max[old_slots] = np.maximum(self.forward_max[old_slots], block[:, :W - k].max(axis=0))
+        upper = np.triu(np.ones((k, k), dtype=bool))
+        self.forward_max[new_slots] = np.where(upper, block[:, W - k:], -np.inf).max(axis=1)
+
+        self.start = start
+        return self
+
+    def recurrence_matrix(self, threshold, threshold_type="dynamic"):
+        """
+        以当前窗口的距离计算二值化重建矩阵，行列按时间顺序排列。
+        :param threshold: 阈值（含义见 RecurrenceAnalysis.compute_reconstruction_matrix）；阈值序列时返回 (T, W, W)
+        :param threshold_type: "static"、"dynamic"、"rr" 或 "knn"
+        """
+        thresholds = np.atleast_1d(np.asarray(threshold, dtype=np.float64))
+        W = self.window_points
+        # 各槽位存放的点：复核距离时使用
+        points = self.phase_space[self.start + (np.arange(W) - self.start) % W]
+        if threshold_type == "dynamic":
+            # 每对点的距离都计入较早一点的 forward_max，候选元素必在其所在行中
+            hi = RecurrenceAnalysis._exact_extremum(self.distance, points, points, self.error, True, self.metric,
+                                                    row_extrema=self.forward_max)
+            dTH = (hi * thresholds)[:, None]
+        else:
+            # 环形缓冲区与按时间排列的矩阵只差行列的同一置换，分位数与每列近邻不受影响
+            dTH = RecurrenceAnalysis._exact_thresholds(self.distance[None], points[None], points[None], thresholds,
+                                                       threshold_type, self.error, self.metric)[0]
+        offset = self.start % W
+        recurrence = RecurrenceAnalysis._exact_recurrence(self.distance, dTH, points, points, self.error, self.metric)
+        matrix = np.roll(recurrence, (-offset, -offset), axis=(1, 2))
+        return matrix[0] if np.ndim(threshold) == 0 else matrix
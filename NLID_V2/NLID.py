@@ -1,16 +1,61 @@
 import os
+import re
+import importlib
 import threading
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk, scrolledtext
 import pandas as pd
 import numpy as np
 from NLIDOOP3 import RecurrenceAnalysis
+from RQA import RQAMeasures
+
+class WindowSeriesWriter:
+    """
+    逐檔追加寫出每個窗口的 NLID（CSV 或 Parquet），處理完一個檔案就寫入，記憶體不隨檔案數增加。
+    """
+    @staticmethod
+    def parquet_available():
+        """
+        Parquet 需要選用套件 pyarrow，未安裝時只提供 CSV。
+        """
+        try:
+            importlib.import_module("pyarrow.parquet")
+        except ImportError:
+            return False
+        return True
+
+    def __init__(self, path, fmt="csv"):
+        self.path = path
+        self.fmt = fmt
+        self.writer = None
+        self.started = False
+        if os.path.exists(path):
+            os.remove(path)
+
+    def write(self, frame):
+        if self.fmt == "parquet":
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if self.writer is None:
+                self.writer = pq.ParquetWriter(self.path, table.schema)
+            self.writer.write_table(table)
+        else:
+            frame.to_csv(self.path, mode='a', header=not self.started, index=False, encoding='utf-8-sig')
+        self.started = True
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
 
 class NLIDApp:
     def __init__(self, master):
         self.master = master
         master.title("NLID 批次分析工具（支援參數輸入與滑動窗口）")
         master.geometry("900x650")
+        # 自動估計的 (m, tau)，依 (檔案, 修改時間, 欄位, 固定參數) 快取，同一資料夾只分析一次
+        self.embedding_cache = {}
 
         container = ttk.Frame(master, padding=10)
         container.pack(fill='both', expand=True)
@@ -35,15 +80,28 @@ class NLIDApp:
         ttk.Label(column_frame, text="Column Y:").grid(row=1, column=0, sticky='e')
         self.combo_col_y = ttk.Combobox(column_frame, state="readonly", width=30)
         self.combo_col_y.grid(row=1, column=1, sticky='w', padx=5)
+        # 選填：與 X / Y 聯合嵌入的第二欄（例如眼動的 X、Y 座標一起嵌入）
+        ttk.Label(column_frame, text="Joint with X (optional):").grid(row=2, column=0, sticky='e')
+        self.combo_col_x2 = ttk.Combobox(column_frame, state="readonly", width=30)
+        self.combo_col_x2.grid(row=2, column=1, sticky='w', padx=5)
+        ttk.Label(column_frame, text="Joint with Y (optional):").grid(row=3, column=0, sticky='e')
+        self.combo_col_y2 = ttk.Combobox(column_frame, state="readonly", width=30)
+        self.combo_col_y2.grid(row=3, column=1, sticky='w', padx=5)
+
+        # Multi-channel selection
+        self.multi_channel = tk.BooleanVar(value=False)
+        ttk.Checkbutton(column_frame, text="All pairs (multi-channel)", variable=self.multi_channel).grid(row=0, column=2, sticky='w', padx=15)
+        self.list_channels = tk.Listbox(column_frame, selectmode=tk.MULTIPLE, height=4, exportselection=False)
+        self.list_channels.grid(row=1, column=2, rowspan=2, sticky='w', padx=15)
 
         # Parameters
         param_frame = ttk.Labelframe(container, text="Parameters", padding=10)
         param_frame.pack(fill='x', pady=5)
-        ttk.Label(param_frame, text="Embedding dimension (m):").grid(row=0, column=0, sticky='w')
+        ttk.Label(param_frame, text="Embedding dimension (m, or auto):").grid(row=0, column=0, sticky='w')
         self.entry_m = ttk.Entry(param_frame, width=10)
         self.entry_m.insert(0, "3")
         self.entry_m.grid(row=0, column=1, sticky='w', padx=5)
-        ttk.Label(param_frame, text="Delay (tau):").grid(row=1, column=0, sticky='w')
+        ttk.Label(param_frame, text="Delay (tau, or auto):").grid(row=1, column=0, sticky='w')
         self.entry_tau = ttk.Entry(param_frame, width=10)
         self.entry_tau.insert(0, "1")
         self.entry_tau.grid(row=1, column=1, sticky='w', padx=5)
@@ -55,6 +113,48 @@ class NLIDApp:
         self.entry_overlap = ttk.Entry(param_frame, width=10)
         self.entry_overlap.insert(0, "0.5")
         self.entry_overlap.grid(row=3, column=1, sticky='w', padx=5)
+        ttk.Label(param_frame, text="Memory limit (MB, 0 = default):").grid(row=4, column=0, sticky='w')
+        self.entry_memory = ttk.Entry(param_frame, width=10)
+        self.entry_memory.insert(0, "0")
+        self.entry_memory.grid(row=4, column=1, sticky='w', padx=5)
+        ttk.Label(param_frame, text="Engine:").grid(row=5, column=0, sticky='w')
+        self.combo_engine = ttk.Combobox(param_frame, state="readonly", width=12, values=["Batched", "Incremental", "Tiled", "Sparse", "Fused", "Symmetric"])
+        self.combo_engine.set("Batched")
+        self.combo_engine.grid(row=5, column=1, sticky='w', padx=5)
+        ttk.Label(param_frame, text="Threshold(s), comma-separated:").grid(row=6, column=0, sticky='w')
+        self.entry_threshold = ttk.Entry(param_frame, width=30)
+        self.entry_threshold.insert(0, "0.1")
+        self.entry_threshold.grid(row=6, column=1, sticky='w', padx=5)
+        ttk.Label(param_frame, text="Threshold type:").grid(row=7, column=0, sticky='w')
+        self.combo_threshold_type = ttk.Combobox(param_frame, state="readonly", width=12, values=["dynamic", "static", "rr", "knn"])
+        self.combo_threshold_type.set("dynamic")
+        self.combo_threshold_type.grid(row=7, column=1, sticky='w', padx=5)
+        self.emit_rqa = tk.BooleanVar(value=False)
+        ttk.Checkbutton(param_frame, text="Emit RQA measures (per window and per file)", variable=self.emit_rqa).grid(row=8, column=0, columnspan=2, sticky='w', pady=5)
+        self.export_windows = tk.BooleanVar(value=False)
+        ttk.Checkbutton(param_frame, text="Export per-window NLID as:", variable=self.export_windows).grid(row=9, column=0, sticky='w')
+        self.combo_export_format = ttk.Combobox(param_frame, state="readonly", width=12,
+                                                values=["CSV", "Parquet"] if WindowSeriesWriter.parquet_available() else ["CSV"])
+        self.combo_export_format.set("CSV")
+        self.combo_export_format.grid(row=9, column=1, sticky='w', padx=5)
+        ttk.Label(param_frame, text="Sampling rate (Hz, 0 = samples):").grid(row=10, column=0, sticky='w')
+        self.entry_fs = ttk.Entry(param_frame, width=10)
+        self.entry_fs.insert(0, "0")
+        self.entry_fs.grid(row=10, column=1, sticky='w', padx=5)
+        self.emit_cross = tk.BooleanVar(value=False)
+        ttk.Checkbutton(param_frame, text="Emit cross/joint recurrence rates (CRR, JRR)", variable=self.emit_cross).grid(row=11, column=0, columnspan=2, sticky='w', pady=5)
+        self.surrogate_test = tk.BooleanVar(value=False)
+        ttk.Checkbutton(param_frame, text="Surrogate p-values (count, method):", variable=self.surrogate_test).grid(row=12, column=0, sticky='w')
+        self.entry_surrogates = ttk.Entry(param_frame, width=10)
+        self.entry_surrogates.insert(0, "100")
+        self.entry_surrogates.grid(row=12, column=1, sticky='w', padx=5)
+        self.combo_surrogate_method = ttk.Combobox(param_frame, state="readonly", width=12, values=["phase", "iaaft"])
+        self.combo_surrogate_method.set("phase")
+        self.combo_surrogate_method.grid(row=12, column=2, sticky='w', padx=5)
+        ttk.Label(param_frame, text="Distance metric:").grid(row=13, column=0, sticky='w')
+        self.combo_metric = ttk.Combobox(param_frame, state="readonly", width=12, values=list(RecurrenceAnalysis.METRICS))
+        self.combo_metric.set("euclidean")
+        self.combo_metric.grid(row=13, column=1, sticky='w', padx=5)
 
         # Progress and log
         progress_frame = ttk.Frame(container)
@@ -71,10 +171,10 @@ class NLIDApp:
         if folder:
             self.entry_folder.delete(0, tk.END)
             self.entry_folder.insert(0, folder)
-            self.combo_col_x['values'] = []
-            self.combo_col_y['values'] = []
-            self.combo_col_x.set('')
-            self.combo_col_y.set('')
+            for combo in (self.combo_col_x, self.combo_col_y, self.combo_col_x2, self.combo_col_y2):
+                combo['values'] = []
+                combo.set('')
+            self.list_channels.delete(0, tk.END)
 
     def load_columns(self):
         folder = self.entry_folder.get()
@@ -91,6 +191,11 @@ class NLIDApp:
             cols = [''] + list(df.columns.str.strip())
             self.combo_col_x['values'] = cols
             self.combo_col_y['values'] = cols
+            self.combo_col_x2['values'] = cols
+            self.combo_col_y2['values'] = cols
+            self.list_channels.delete(0, tk.END)
+            for col in cols[1:]:
+                self.list_channels.insert(tk.END, col)
             messagebox.showinfo("Columns Loaded", f"Loaded columns from {files[0]}")
         except Exception as e:
             messagebox.showerror("Load Error", str(e))
@@ -104,85 +209,320 @@ class NLIDApp:
         col_x = self.combo_col_x.get()
         col_y = self.combo_col_y.get()
         try:
-            m = int(self.entry_m.get())
-            tau = int(self.entry_tau.get())
+            # "auto" 表示每個檔案以 FNN / AMI 自動估計
+            m = None if self.entry_m.get().strip().lower() == "auto" else int(self.entry_m.get())
+            tau = None if self.entry_tau.get().strip().lower() == "auto" else int(self.entry_tau.get())
             window_size = int(self.entry_window.get())
             overlap = float(self.entry_overlap.get())
+            memory_limit = float(self.entry_memory.get())
+            thresholds = [float(t) for t in self.entry_threshold.get().split(",") if t.strip()]
+            fs = float(self.entry_fs.get())
+            n_surrogates = int(self.entry_surrogates.get())
         except ValueError:
-            messagebox.showerror("Invalid input", "m, tau, window size must be integers and overlap a float.")
+            messagebox.showerror("Invalid input", "m, tau (or auto), window size, surrogate count must be integers and overlap, memory limit, thresholds floats.")
+            return
+        if not thresholds:
+            messagebox.showerror("Invalid threshold", "Enter at least one threshold.")
             return
-        if not os.path.isdir(folder) or not col_x or not col_y:
+        multi_channel = self.multi_channel.get()
+        channels = [self.list_channels.get(i) for i in self.list_channels.curselection()]
+        if multi_channel and (not os.path.isdir(folder) or len(channels) < 2):
+            messagebox.showerror("Missing info", "Ensure folder and at least two channels are selected.")
+            return
+        if not multi_channel and (not os.path.isdir(folder) or not col_x or not col_y):
             messagebox.showerror("Missing info", "Ensure folder and two columns are selected.")
             return
+        if (m is not None and m < 1) or (tau is not None and tau < 1):
+            messagebox.showerror("Invalid embedding", "m and tau must be >=1 (or auto).")
+            return
         if window_size <= 0 or not (0 <= overlap < 1):
             messagebox.showerror("Invalid window settings", "Window size must be >0 and 0<=overlap<1.")
             return
-        threading.Thread(target=self.process_files, args=(folder, col_x, col_y, m, tau, window_size, overlap), daemon=True).start()
+        if memory_limit < 0:
+            messagebox.showerror("Invalid memory limit", "Memory limit must be >=0 (0 uses the default).")
+            return
+        if fs < 0:
+            messagebox.showerror("Invalid sampling rate", "Sampling rate must be >=0 (0 reports window starts in samples).")
+            return
+        surrogates = (n_surrogates, self.combo_surrogate_method.get()) if self.surrogate_test.get() else None
+        if surrogates and n_surrogates < 1:
+            messagebox.showerror("Invalid surrogates", "Surrogate count must be >=1.")
+            return
+        memory_limit_mb = memory_limit if memory_limit > 0 else None
+        engine = self.combo_engine.get().lower()
+        threshold_type = self.combo_threshold_type.get()
+        # rr 為重現率，knn 為每列的近鄰個數
+        if threshold_type == "rr" and not all(0 < t <= 1 for t in thresholds):
+            messagebox.showerror("Invalid threshold", "Recurrence-rate thresholds must satisfy 0 < rr <= 1.")
+            return
+        if threshold_type == "knn" and not all(t >= 1 and float(t).is_integer() for t in thresholds):
+            messagebox.showerror("Invalid threshold", "knn thresholds must be integers >= 1 (neighbours per column).")
+            return
+        if engine in ("sparse", "fused") and threshold_type not in ("static", "dynamic"):
+            messagebox.showerror("Invalid engine", "The Sparse and Fused engines support static and dynamic thresholds only.")
+            return
+        if engine == "symmetric" and threshold_type == "knn":
+            messagebox.showerror("Invalid engine", "The Symmetric engine does not support knn thresholds.")
+            return
+        metric = self.combo_metric.get()
+        emit_rqa = self.emit_rqa.get()
+        if emit_rqa and engine not in ("batched", "incremental", "tiled"):
+            messagebox.showerror("Invalid engine", "RQA output needs the Batched, Incremental or Tiled engine.")
+            return
+        emit_cross = self.emit_cross.get()
+        if emit_cross and (engine not in ("batched", "incremental", "tiled") or threshold_type == "knn"):
+            messagebox.showerror("Invalid engine", "CRR/JRR output needs the Batched, Incremental or Tiled engine and a non-knn threshold.")
+            return
+        if multi_channel:
+            if engine in ("sparse", "fused", "symmetric"):
+                messagebox.showerror("Invalid engine", "Multi-channel mode supports the Batched, Incremental and Tiled engines only.")
+                return
+            threading.Thread(target=self.process_files_matrix, args=(folder, channels, m, tau, window_size, overlap, memory_limit_mb, engine, thresholds, threshold_type, metric), daemon=True).start()
+            return
+        # 選了聯合欄位時，X / Y 以多欄聯合嵌入（每欄 z 標準化）
+        col_x2 = self.combo_col_x2.get()
+        col_y2 = self.combo_col_y2.get()
+        if emit_cross and bool(col_x2) != bool(col_y2):
+            messagebox.showerror("Invalid columns", "CRR/JRR output needs the same number of columns for X and Y.")
+            return
+        if surrogates and col_y2:
+            messagebox.showerror("Invalid columns", "Surrogate p-values need a single Y column.")
+            return
+        col_x = [col_x, col_x2] if col_x2 else col_x
+        col_y = [col_y, col_y2] if col_y2 else col_y
+        export_format = self.combo_export_format.get().lower() if self.export_windows.get() else None
+        if export_format == "parquet" and not WindowSeriesWriter.parquet_available():
+            self.log_message("pyarrow is not installed; exporting per-window NLID as CSV.")
+            export_format = "csv"
+        threading.Thread(target=self.process_files, args=(folder, col_x, col_y, m, tau, window_size, overlap, memory_limit_mb, engine, thresholds, threshold_type, emit_rqa, export_format, fs, emit_cross, surrogates, metric), daemon=True).start()
 
-    def process_files(self, folder, col_x, col_y, m, tau, window_size, overlap):
+    def resolve_embedding(self, file, columns, series, m, tau):
+        """
+        m 或 tau 為 None 時逐欄自動估計，並取各欄估計值的最大值，使所有欄位共用同一組嵌入參數。
+        """
+        if m is not None and tau is not None:
+            return m, tau
+        estimates = []
+        for col, values in zip(columns, series):
+            key = (os.path.abspath(file), os.path.getmtime(file), col, m, tau)
+            if key not in self.embedding_cache:
+                self.embedding_cache[key] = RecurrenceAnalysis.estimate_embedding(values, m, tau)
+            estimates.append(self.embedding_cache[key])
+        return max(e[0] for e in estimates), max(e[1] for e in estimates)
+
+    def process_files(self, folder, col_x, col_y, m, tau, window_size, overlap, memory_limit_mb=None, engine="batched",
+                      thresholds=(0.1,), threshold_type="dynamic", emit_rqa=False, export_format=None, fs=0, emit_cross=False,
+                      surrogates=None, metric="euclidean"):
         files = [os.path.join(folder, f) for f in os.listdir(folder) if f.lower().endswith(('.xlsx', '.csv'))]
         self.progress['maximum'] = len(files)
         self.progress['value'] = 0
         results = []
+        rqa_rows = []
+        series_writer = None
+        if export_format:
+            series_path = os.path.join(folder, f"NLID_Per_Window.{export_format}")
+            files = [f for f in files if os.path.abspath(f) != os.path.abspath(series_path)]
+            series_writer = WindowSeriesWriter(series_path, export_format)
+
+        # col_x / col_y 可為單一欄名或欄名清單（多欄聯合嵌入）
+        names_x = [c.strip().upper() for c in ([col_x] if isinstance(col_x, str) else col_x)]
+        names_y = [c.strip().upper() for c in ([col_y] if isinstance(col_y, str) else col_y)]
+        cx = "+".join(names_x)
+        cy = "+".join(names_y)
 
         for file in files:
             basename = os.path.basename(file)
             try:
                 df = pd.read_excel(file) if file.endswith(('.xls', '.xlsx')) else pd.read_csv(file)
                 df.columns = df.columns.str.strip().str.upper()
-                cx = col_x.strip().upper()
-                cy = col_y.strip().upper()
 
-                if cx not in df.columns or cy not in df.columns:
+                if any(c not in df.columns for c in names_x + names_y):
                     self.log_message(f"{basename}: missing selected columns.")
                     continue
 
-                x = df[cx].dropna().values
-                y = df[cy].dropna().values
+                # 多欄時以整列剔除缺值，使各通道在時間上對齊
+                x = df[names_x].dropna().values if len(names_x) > 1 else df[names_x[0]].dropna().values
+                y = df[names_y].dropna().values if len(names_y) > 1 else df[names_y[0]].dropna().values
                 min_len = min(len(x), len(y))
                 if min_len < window_size:
                     self.log_message(f"{basename}: data shorter than window size.")
                     continue
 
+                m_file, tau_file = self.resolve_embedding(
+                    file, names_x + names_y, [df[c].dropna().values for c in names_x + names_y], m, tau)
+                if (m_file - 1) * tau_file >= window_size:
+                    self.log_message(f"{basename}: window too short for m={m_file}, tau={tau_file}.")
+                    continue
+
                 # Sliding window
                 step = int(window_size * (1 - overlap))
-                nlid_xy_list = []
-                nlid_yx_list = []
-                for start in range(0, min_len - window_size + 1, step):
-                    x_win = x[start:start + window_size]
-                    y_win = y[start:start + window_size]
+                # 多個閾值共用同一次距離計算，結果為 (窗口數, 閾值數)
+                if emit_rqa or emit_cross:
+                    # RQA、CRR/JRR 與 NLID 共用同一批重建矩陣
+                    analysis = RecurrenceAnalysis.analyze_windows(
+                        x[:min_len], y[:min_len], m_file, tau_file, window_size, step,
+                        threshold=list(thresholds), threshold_type=threshold_type, engine=engine, memory_limit_mb=memory_limit_mb,
+                        rqa=emit_rqa, cross=emit_cross, metric=metric)
+                    nlid_xy_list, nlid_yx_list = analysis["nlid_xy"], analysis["nlid_yx"]
+                elif not surrogates:
+                    nlid_xy_list, nlid_yx_list = RecurrenceAnalysis.nlid_windows(
+                        x[:min_len], y[:min_len], m_file, tau_file, window_size, step,
+                        threshold=list(thresholds), threshold_type=threshold_type, engine=engine, memory_limit_mb=memory_limit_mb,
+                        metric=metric)
 
-                    ra_x = RecurrenceAnalysis(x_win, m=m, tau=tau)
-                    ps_x = ra_x.reconstruct_phase_space()
-                    ra_y = RecurrenceAnalysis(y_win, m=m, tau=tau)
-                    ps_y = ra_y.reconstruct_phase_space()
-
-                    AR_X = RecurrenceAnalysis.compute_reconstruction_matrix(ps_x, threshold=0.1, threshold_type="dynamic")
-                    AR_Y = RecurrenceAnalysis.compute_reconstruction_matrix(ps_y, threshold=0.1, threshold_type="dynamic")
-
-                    nlid_xy, nlid_yx = RecurrenceAnalysis.calculate_nlid(AR_X, AR_Y)
-                    nlid_xy_list.append(nlid_xy)
-                    nlid_yx_list.append(nlid_yx)
+                if surrogates:
+                    # 每個窗口的 AR_X 只算一次，Y 的替代資料成批計算
+                    n_surrogates, method = surrogates
+                    significance = RecurrenceAnalysis.nlid_surrogate_test(
+                        x[:min_len], y[:min_len], m_file, tau_file, window_size, step, threshold=list(thresholds),
+                        threshold_type=threshold_type, n_surrogates=n_surrogates, method=method, memory_limit_mb=memory_limit_mb,
+                        metric=metric, engine=engine)
+                    # 觀測 NLID 直接取自檢定結果，不再另外計算一次重建矩陣
+                    nlid_xy_list, nlid_yx_list = significance["nlid_xy"], significance["nlid_yx"]
 
                 # Compute average NLID
-                avg_xy = np.mean(nlid_xy_list)
-                avg_yx = np.mean(nlid_yx_list)
-
-                results.append({
-                    "檔名": basename,
-                    f"Avg NLID({cx}|{cy})": avg_xy,
-                    f"Avg NLID({cy}|{cx})": avg_yx
-                })
-                self.log_message(f"Processed: {basename} (windows: {len(nlid_xy_list)})")
+                avg_xy = np.mean(nlid_xy_list, axis=0)
+                avg_yx = np.mean(nlid_yx_list, axis=0)
+
+                row = {"檔名": basename}
+                if m is None or tau is None:
+                    row["m"], row["tau"] = m_file, tau_file
+                for i, th in enumerate(thresholds):
+                    suffix = "" if len(thresholds) == 1 else f" @{th:g}"
+                    row[f"Avg NLID({cx}|{cy}){suffix}"] = avg_xy[i]
+                    row[f"Avg NLID({cy}|{cx}){suffix}"] = avg_yx[i]
+                    if surrogates:
+                        row[f"p NLID({cx}|{cy}){suffix}"] = significance["p_file_xy"][i]
+                        row[f"p NLID({cy}|{cx}){suffix}"] = significance["p_file_yx"][i]
+                    if emit_cross:
+                        row[f"Avg CRR({cx},{cy}){suffix}"] = np.mean(analysis["crr"][:, i])
+                        row[f"Avg JRR({cx},{cy}){suffix}"] = np.mean(analysis["jrr"][:, i])
+                if emit_rqa:
+                    for col, key in ((cx, "rqa_x"), (cy, "rqa_y")):
+                        avg_rqa = np.nanmean(analysis[key], axis=0)
+                        for i, th in enumerate(thresholds):
+                            suffix = "" if len(thresholds) == 1 else f" @{th:g}"
+                            for j, name in enumerate(RQAMeasures.MEASURES):
+                                row[f"Avg {name}({col}){suffix}"] = avg_rqa[i, j]
+                    for w, start in enumerate(analysis["start"]):
+                        for i, th in enumerate(thresholds):
+                            rqa_row = {"檔名": basename, "Window start": start, "Threshold": th}
+                            for col, key in ((cx, "rqa_x"), (cy, "rqa_y")):
+                                for j, name in enumerate(RQAMeasures.MEASURES):
+                                    rqa_row[f"{name}({col})"] = analysis[key][w, i, j]
+                            rqa_rows.append(rqa_row)
+                results.append(row)
+                if series_writer is not None:
+                    # 匯出失敗只略過逐窗口檔，不影響彙總結果
+                    try:
+                        # 每個窗口一列、每個閾值一組，寫完即釋放
+                        starts = np.arange(0, min_len - window_size + 1, step)
+                        series = pd.DataFrame({
+                            "檔名": basename,
+                            "Window start": np.repeat(starts, len(thresholds)),
+                            "Threshold": np.tile(np.asarray(thresholds, dtype=np.float64), len(starts)),
+                            f"NLID({cx}|{cy})": np.ravel(nlid_xy_list),
+                            f"NLID({cy}|{cx})": np.ravel(nlid_yx_list),
+                        })
+                        if surrogates:
+                            series[f"p NLID({cx}|{cy})"] = np.ravel(significance["p_xy"])
+                            series[f"p NLID({cy}|{cx})"] = np.ravel(significance["p_yx"])
+                        if emit_cross:
+                            series[f"CRR({cx},{cy})"] = np.ravel(analysis["crr"])
+                            series[f"JRR({cx},{cy})"] = np.ravel(analysis["jrr"])
+                        if fs > 0:
+                            series.insert(2, "Window start (s)", series["Window start"] / fs)
+                        series_writer.write(series)
+                    except Exception as e:
+                        self.log_message(f"{basename}: per-window export failed: {e}")
+                self.log_message(f"Processed: {basename} (windows: {len(nlid_xy_list)}, m={m_file}, tau={tau_file})")
             except Exception as e:
                 self.log_message(f"Error {basename}: {e}")
             self.progress['value'] += 1
 
+        if series_writer is not None:
+            series_writer.close()
+            if series_writer.started:
+                self.log_message(f"Per-window NLID saved to {series_writer.path}")
+
         if results:
             result_df = pd.DataFrame(results)
             output_path = os.path.join(folder, "NLID_Results_Avg.xlsx")
             result_df.to_excel(output_path, index=False)
             self.log_message(f"Results saved to {output_path}")
+            if rqa_rows:
+                rqa_path = os.path.join(folder, "NLID_RQA_Per_Window.xlsx")
+                pd.DataFrame(rqa_rows).to_excel(rqa_path, index=False)
+                self.log_message(f"RQA per window saved to {rqa_path}")
+            messagebox.showinfo("Done", f"Analysis completed. Saved to: {output_path}")
+        else:
+            messagebox.showwarning("No Data", "No valid files processed.")
+
+    def process_files_matrix(self, folder, channels, m, tau, window_size, overlap, memory_limit_mb=None, engine="batched",
+                             thresholds=(0.1,), threshold_type="dynamic", metric="euclidean"):
+        files = [os.path.join(folder, f) for f in os.listdir(folder) if f.lower().endswith(('.xlsx', '.csv'))]
+        self.progress['maximum'] = len(files)
+        self.progress['value'] = 0
+        results = {}
+        names = [c.strip().upper() for c in channels]
+
+        for file in files:
+            basename = os.path.basename(file)
+            try:
+                df = pd.read_excel(file) if file.endswith(('.xls', '.xlsx')) else pd.read_csv(file)
+                df.columns = df.columns.str.strip().str.upper()
+                missing = [c for c in names if c not in df.columns]
+                if missing:
+                    self.log_message(f"{basename}: missing columns {', '.join(missing)}.")
+                    continue
+
+                data = [df[c].dropna().values for c in names]
+                if min(len(d) for d in data) < window_size:
+                    self.log_message(f"{basename}: data shorter than window size.")
+                    continue
+
+                m_file, tau_file = self.resolve_embedding(file, names, data, m, tau)
+                if (m_file - 1) * tau_file >= window_size:
+                    self.log_message(f"{basename}: window too short for m={m_file}, tau={tau_file}.")
+                    continue
+
+                # 每個通道的重建矩陣只算一次，所有通道對共用
+                step = int(window_size * (1 - overlap))
+                matrices = RecurrenceAnalysis.nlid_matrix_windows(
+                    data, m_file, tau_file, window_size, step, threshold=list(thresholds), threshold_type=threshold_type,
+                    engine=engine, memory_limit_mb=memory_limit_mb, metric=metric)
+                avg = np.mean(matrices, axis=0)
+
+                frames = []
+                for i, th in enumerate(thresholds):
+                    frame = pd.DataFrame(avg[i], index=names, columns=names)
+                    frame.index.name = "NLID(row|column)"
+                    frame.insert(0, "Threshold", th)
+                    if m is None or tau is None:
+                        frame.insert(1, "m", m_file)
+                        frame.insert(2, "tau", tau_file)
+                    frames.append(frame)
+                results[basename] = pd.concat(frames)
+                self.log_message(f"Processed: {basename} (windows: {len(matrices)}, channels: {len(names)}, m={m_file}, tau={tau_file})")
+            except Exception as e:
+                self.log_message(f"Error {basename}: {e}")
+            self.progress['value'] += 1
+
+        if results:
+            output_path = os.path.join(folder, "NLID_Results_Matrix.xlsx")
+            with pd.ExcelWriter(output_path) as writer:
+                used = set()
+                for basename, frame in results.items():
+                    # 工作表名稱最多 31 字元且不分大小寫；截斷後重複時加上序號，否則後者會覆寫前者
+                    base = re.sub(r'[\\/*?:[\]"]', '_', basename)[:31]
+                    sheet_name, index = base, 1
+                    while sheet_name.lower() in used:
+                        suffix = f"_{index}"
+                        sheet_name = base[:31 - len(suffix)] + suffix
+                        index += 1
+                    used.add(sheet_name.lower())
+                    frame.to_excel(writer, sheet_name=sheet_name)
+            self.log_message(f"Results saved to {output_path}")
             messagebox.showinfo("Done", f"Analysis completed. Saved to: {output_path}")
         else:
             messagebox.showwarning("No Data", "No valid files processed.")
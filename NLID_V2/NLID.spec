@@ -10,7 +10,9 @@ a = Analysis(
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    # NLID.exe 只做批次計算不繪圖；onefile 每次啟動都要解壓全部內容，排除繪圖與未用的 GUI 綁定可縮短冷啟動
+    # numba/llvmlite 約佔一半體積；排除後 fused 引擎改用結果相同的 NumPy 版本
+    excludes=['numba', 'llvmlite', 'matplotlib', 'PyQt5', 'PyQt6', 'PySide2', 'PySide6', 'IPython', 'jupyter_client', 'notebook', 'pytest'],
     noarchive=False,
     optimize=0,
 )
@@ -0,0 +1,74 @@
+import numpy as np
+from NLIDOOP3 import RecurrenceAnalysis
+
+class RQAMeasures:
+    # 输出的指标及顺序
+    MEASURES = ("RR", "DET", "LAM", "L", "TT", "Lmax")
+
+    @staticmethod
+    def _run_lengths(lines):
+        """
+        向量化统计每一行中连续 1 的长度。
+        :param lines: 布尔矩阵 (行数, 长度)，每一行为一条对角线或一列
+        :return: 所有连续段的长度（一维数组）
+        """
+        padded = np.zeros((lines.shape[0], lines.shape[1] + 2), dtype=np.int8)
+        padded[:, 1:-1] = lines
+        # 每行两端都补 0，展平后相邻行的边界不会误连
+        edges = np.diff(padded.ravel())
+        return np.flatnonzero(edges == -1) - np.flatnonzero(edges == 1)
+
+    @staticmethod
+    def _diagonals(matrix):
+        """
+        以跨步视图取出矩阵第 1 ~ N-1 条上对角线，每条对角线为一行，不足部分补 0。
+        """
+        N = matrix.shape[0]
+        skewed = np.zeros((N, 2 * N), dtype=bool)
+        skewed[:, :N] = matrix
+        # 第 k 行第 i 个元素为 skewed[i, i + k]
+        view = np.lib.stride_tricks.as_strided(skewed.ravel(), shape=(N, N), strides=(1, 2 * N + 1), writeable=False)
+        return view[1:]
+
+    @staticmethod
+    def compute(matrix, lmin=2, vmin=2):
+        """
+        由二值化重建矩阵计算 RQA 指标。
+        :param matrix: 二值化重建矩阵 (N, N)，或 pack_recurrence_matrix 的打包位矩阵
+        :param lmin: 对角线的最短长度
+        :param vmin: 垂直线的最短长度
+        :return: 字典，包含重现率 RR、确定性 DET、层流性 LAM、平均对角线长度 L、
+                 捕获时间 TT 与最长对角线 Lmax
+        """
+        if matrix.dtype == np.uint64:
+            matrix = RecurrenceAnalysis.unpack_recurrence_matrix(matrix, matrix.shape[0])
+        matrix = np.asarray(matrix, dtype=bool)
+        N = matrix.shape[0]
+
+        # 对角线（不含主对角线），上下两半分别统计
+        diagonal = np.concatenate([
+            RQAMeasures._run_lengths(RQAMeasures._diagonals(matrix)),
+            RQAMeasures._run_lengths(RQAMeasures._diagonals(matrix.T))])
+        vertical = RQAMeasures._run_lengths(matrix.T)
+
+        long_diagonal = diagonal[diagonal >= lmin]
+        long_vertical = vertical[vertical >= vmin]
+        diagonal_points = diagonal.sum()
+        vertical_points = vertical.sum()
+
+        return {
+            "RR": vertical_points / N**2,
+            "DET": long_diagonal.sum() / diagonal_points if diagonal_points else np.nan,
+            "LAM": long_vertical.sum() / vertical_points if vertical_points else np.nan,
+            "L": long_diagonal.mean() if len(long_diagonal) else np.nan,
+            "TT": long_vertical.mean() if len(long_vertical) else np.nan,
+            "Lmax": long_diagonal.max() if len(long_diagonal) else 0,
+        }
+
+    @staticmethod
+    def compute_array(matrix, lmin=2, vmin=2):
+        """
+        同 compute，按 MEASURES 的顺序返回数组。
+        """
+        measures = RQAMeasures.compute(matrix, lmin, vmin)
+        return np.array([measures[name] for name in RQAMeasures.MEASURES], dtype=np.float64)
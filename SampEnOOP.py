@@ -0,0 +1,459 @@
+import os
+import sys
+import time
+from statistics import NormalDist
+
+import numpy as np
+
+try:
+    from numba import njit, prange
+except ImportError:  # numba 为可选依赖，未安装时使用 KD 树版本
+    njit = None
+
+# 编译结果写入 __pycache__，批处理的子进程无需重新编译；
+# 只有字节码（PyInstaller 打包、只发布 .pyc）时 numba 无处定位缓存，此时不缓存
+_CACHE = not getattr(sys, "frozen", False) and __file__.endswith(".py") and os.path.isfile(__file__)
+
+if njit is not None:
+    @njit(parallel=True, cache=_CACHE)
+    def _match_counts_kernel(data, starts, n_templates, emb_dim, lag, tolerances, closed):
+        # 每个窗口按模板第一个坐标排序，只扫描第一个坐标在容差内的模板（排序坐标剪枝）
+        counts = np.zeros((len(starts), 2), dtype=np.int64)
+        for w in prange(len(starts)):
+            s = starts[w]
+            r = tolerances[w]
+            first = data[s:s + n_templates]
+            order = np.argsort(first, kind='mergesort')
+            sorted_first = first[order]
+            count_m = 0
+            count_m1 = 0
+            for ii in range(n_templates):
+                i = s + order[ii]
+                for jj in range(ii + 1, n_templates):
+                    gap = sorted_first[jj] - sorted_first[ii]
+                    if gap > r or (gap == r and not closed):
+                        break
+                    j = s + order[jj]
+                    similar = True
+                    for k in range(1, emb_dim):
+                        d = abs(data[i + k * lag] - data[j + k * lag])
+                        if d > r or (d == r and not closed):
+                            similar = False
+                            break
+                    if similar:
+                        count_m += 1
+                        # 第 emb_dim + 1 个坐标也在容差内，即长度 emb_dim + 1 的匹配
+                        d = abs(data[i + emb_dim * lag] - data[j + emb_dim * lag])
+                        if d < r or (d == r and closed):
+                            count_m1 += 1
+            counts[w, 0] = count_m
+            counts[w, 1] = count_m1
+        return counts
+
+    @njit(parallel=True, cache=_CACHE)
+    def _curve_counts_kernel(data, starts, window, emb_dims, lag, tolerances, closed):
+        # 一次遍历模板对，累计每个维度的 (B, A)：长度 m + 1 的匹配是长度 m 匹配的子集，
+        # 前缀切比雪夫距离只算一遍；emb_dims 须严格递增，tolerances 形状为 (窗口数, 维度数)
+        n_dims = len(emb_dims)
+        counts = np.zeros((len(starts), n_dims, 2), dtype=np.int64)
+        for w in prange(len(starts)):
+            s = starts[w]
+            r_max = tolerances[w].max()
+            # 最小维度的模板最多，较大维度只使用其中前 window - m × lag 个
+            n_first = window - emb_dims[0] * lag
+            first = data[s:s + n_first]
+            order = np.argsort(first, kind='mergesort')
+            sorted_first = first[order]
+            local = np.zeros((n_dims, 2), dtype=np.int64)
+            for ii in range(n_first):
+                for jj in range(ii + 1, n_first):
+                    gap = sorted_first[jj] - sorted_first[ii]
+                    if gap > r_max or (gap == r_max and not closed):
+                        break
+                    i = s + order[ii]
+                    j = s + order[jj]
+                    # 较晚的模板超出较大维度的模板范围时，只计入较小的维度
+                    last = max(order[ii], order[jj])
+                    n_valid = 0
+                    while n_valid < n_dims and last < window - emb_dims[n_valid] * lag:
+                        n_valid += 1
+                    # d 为前 k + 1 个坐标的切比雪夫距离：k = m - 1 时判断长度 m 的匹配 (B)，
+                    # k = m 时判断长度 m + 1 的匹配 (A)；超出最大容差后之后的维度都不匹配
+                    d = gap
+                    qa = 0
+                    qb = 0
+                    for k in range(emb_dims[n_valid - 1] + 1):
+                        if k > 0:
+                            d = max(d, abs(data[i + k * lag] - data[j + k * lag]))
+                        if d > r_max or (d == r_max and not closed):
+                            break
+                        if qa < n_valid and emb_dims[qa] == k:
+                            r = tolerances[w, qa]
+                            if d < r or (d == r and closed):
+                                local[qa, 1] += 1
+                            qa += 1
+                        if qb < n_valid and emb_dims[qb] == k + 1:
+                            r = tolerances[w, qb]
+                            if d < r or (d == r and closed):
+                                local[qb, 0] += 1
+                            qb += 1
+            counts[w] = local
+        return counts
+
+
+class SampleEntropy:
+    # 单条长序列的模板数超过此值时改用 KD 树（排序剪枝只利用一个坐标，长序列时候选过多）
+    KDTREE_MIN_TEMPLATES = 20000
+    # 增量计数时每块距离矩阵的元素个数，使临时数组留在缓存内
+    BLOCK_CELLS = 2**15
+    # 步长超过模板数的 1/n 时增量更新不再比逐窗口完整计数快（numba 计数核更快，交叉点更早）
+    SLIDING_STEP_DIVISOR = 4
+    SLIDING_STEP_DIVISOR_NUMBA = 20
+    # 蒙特卡洛估计每批抽取的模板对数，以及未设时间预算时的抽样上限
+    MC_BATCH_PAIRS = 2**16
+    MC_MAX_PAIRS = 2**27
+
+    @staticmethod
+    def default_tolerance(data, emb_dim):
+        """
+        与 nolds.sampen 相同的默认容差：0.2 × 标准差（emb_dim = 2），并按维度校正。
+        :param data: 一维时间序列
+        :param emb_dim: 嵌入维度
+        """
+        return np.std(data, ddof=1) * 0.1164 * (0.5627 * np.log(emb_dim) + 1.3334)
+
+    @staticmethod
+    def embed(data, emb_dim, lag=1):
+        """
+        零拷贝的模板矩阵（只读跨步视图），第 i 行为 [x_i, x_{i+lag}, ..., x_{i+(emb_dim-1)lag}]。
+        """
+        data = np.asarray(data, dtype=np.float64)
+        span = (emb_dim - 1) * lag + 1
+        return np.lib.stride_tricks.sliding_window_view(data, span)[:, ::lag]
+
+    @staticmethod
+    def _kdtree_counts(templates, emb_dim, tolerance, closed):
+        """
+        以 KD 树（切比雪夫距离）统计长度 emb_dim 与 emb_dim + 1 的相似模板对数。
+        开区间 d < r 等价于 d <= r 的前一个浮点数，计数与逐对比较完全相同。
+        """
+        from scipy.spatial import cKDTree
+
+        radius = tolerance if closed else np.nextafter(tolerance, -np.inf)
+        if radius < 0:
+            return 0, 0
+        N = len(templates)
+        counts = []
+        for dim in (emb_dim, emb_dim + 1):
+            points = np.ascontiguousarray(templates[:, :dim])
+            tree = cKDTree(points)
+            # 计数含自身与两个方向，去掉后即为 i < j 的模板对数
+            counts.append(int(tree.count_neighbors(tree, radius, p=np.inf) - N) // 2)
+        return counts[0], counts[1]
+
+    @staticmethod
+    def match_counts(data, emb_dim=2, tolerance=None, lag=1, closed=False, use_numba=True):
+        """
+        统计相似模板对数 (B, A)：B 为长度 emb_dim、A 为长度 emb_dim + 1 的模板对数（不含自身匹配）。
+        模板取法与 nolds.sampen 相同，两种长度都只使用前 n - emb_dim × lag 个模板。
+        :param data: 一维时间序列
+        :param emb_dim: 嵌入维度
+        :param tolerance: 容差，None 时使用 default_tolerance
+        :param lag: 嵌入延迟
+        :param closed: True 时 d <= r 视为相似，否则 d < r
+        :param use_numba: 是否在可用时使用 numba 编译核
+        """
+        data = np.asarray(data, dtype=np.float64)
+        if tolerance is None:
+            tolerance = SampleEntropy.default_tolerance(data, emb_dim)
+        n_templates = len(data) - emb_dim * lag
+        if n_templates < 2:
+            return 0, 0
+        if use_numba and njit is not None and n_templates < SampleEntropy.KDTREE_MIN_TEMPLATES:
+            counts = _match_counts_kernel(data, np.zeros(1, dtype=np.int64), n_templates, emb_dim, lag,
+                                          np.array([tolerance], dtype=np.float64), closed)
+            return int(counts[0, 0]), int(counts[0, 1])
+        templates = SampleEntropy.embed(data, emb_dim + 1, lag)[:n_templates]
+        return SampleEntropy._kdtree_counts(templates, emb_dim, tolerance, closed)
+
+    @staticmethod
+    def _entropy_from_counts(count_m, count_m1):
+        """
+        由模板对数求样本熵；计数为 0 时与 nolds 相同，返回 inf、-inf 或 nan。
+        """
+        if count_m > 0 and count_m1 > 0:
+            return -np.log(1.0 * count_m1 / count_m)
+        if count_m == 0 and count_m1 == 0:
+            return np.nan
+        return -np.inf if count_m == 0 else np.inf
+
+    @staticmethod
+    def sampen(data, emb_dim=2, tolerance=None, lag=1, closed=False, use_numba=True):
+        """
+        计算样本熵，结果与 nolds.sampen（切比雪夫距离）逐位相同。
+        参数同 match_counts。
+        """
+        return SampleEntropy._entropy_from_counts(
+            *SampleEntropy.match_counts(data, emb_dim, tolerance, lag, closed, use_numba))
+
+    @staticmethod
+    def _wilson_interval(successes, trials, z):
+        """
+        二项比例的 Wilson 置信区间。
+        """
+        if trials == 0:
+            return 0.0, 1.0
+        p = successes / trials
+        centre = (p + z**2 / (2 * trials)) / (1 + z**2 / trials)
+        half = z / (1 + z**2 / trials) * np.sqrt(p * (1 - p) / trials + z**2 / (4 * trials**2))
+        return max(0.0, centre - half), min(1.0, centre + half)
+
+    @staticmethod
+    def sampen_monte_carlo(data, emb_dim=2, tolerance=None, lag=1, closed=False, max_error=0.02, time_budget=None,
+                           confidence=0.95, rng=None):
+        """
+        以随机抽样的模板对估计样本熵，用于完整计数 O(N²) 过慢的长记录。
+        均匀抽取模板对 (i ≠ j)：长度 emb_dim 的匹配数 b 与其中长度 emb_dim + 1 的匹配数 a
+        给出 A / B 的估计 a / b；在已匹配的模板对中 a 服从二项分布，以 Wilson 区间换算为样本熵的置信区间。
+        置信区间半宽不超过 max_error、用时超过 time_budget 或抽满 MC_MAX_PAIRS 时停止；
+        模板对总数不多于一批时直接完整计数（区间宽度为 0）。
+        :param data: 一维时间序列
+        :param emb_dim: 嵌入维度
+        :param tolerance: 容差，None 时使用 default_tolerance（整个序列）
+        :param lag: 嵌入延迟
+        :param closed: True 时 d <= r 视为相似，否则 d < r
+        :param max_error: 置信区间半宽的目标（样本熵单位）
+        :param time_budget: 最长用时（秒），None 表示不限
+        :param confidence: 置信水平
+        :param rng: np.random.Generator
+        :return: (估计值, 置信下限, 置信上限, 抽取的模板对数)
+        """
+        data = np.asarray(data, dtype=np.float64)
+        if tolerance is None:
+            tolerance = SampleEntropy.default_tolerance(data, emb_dim)
+        n_templates = len(data) - emb_dim * lag
+        if n_templates * (n_templates - 1) // 2 <= SampleEntropy.MC_BATCH_PAIRS:
+            entropy = SampleEntropy.sampen(data, emb_dim, tolerance, lag, closed)
+            return entropy, entropy, entropy, max(0, n_templates * (n_templates - 1) // 2)
+
+        rng = rng or np.random.default_rng()
+        within = np.less_equal if closed else np.less
+        z = NormalDist().inv_cdf((1 + confidence) / 2)
+        started = time.perf_counter()
+        count_m = count_m1 = n_pairs = 0
+        low = high = np.nan
+        while n_pairs < SampleEntropy.MC_MAX_PAIRS:
+            i = rng.integers(0, n_templates, SampleEntropy.MC_BATCH_PAIRS)
+            j = rng.integers(0, n_templates, SampleEntropy.MC_BATCH_PAIRS)
+            i, j = i[i != j], j[i != j]
+            distances = np.abs(data[i] - data[j])
+            for k in range(1, emb_dim):
+                np.maximum(distances, np.abs(data[i + k * lag] - data[j + k * lag]), out=distances)
+            similar_m = within(distances, tolerance)
+            count_m += np.count_nonzero(similar_m)
+            count_m1 += np.count_nonzero(
+                within(np.abs(data[i[similar_m] + emb_dim * lag] - data[j[similar_m] + emb_dim * lag]), tolerance))
+            n_pairs += len(i)
+
+            # A / B 的 Wilson 区间换算为样本熵区间：-log 单调递减，上下限互换
+            ratio_low, ratio_high = SampleEntropy._wilson_interval(count_m1, count_m, z)
+            low = -np.log(ratio_high) if ratio_high > 0 else np.inf
+            high = -np.log(ratio_low) if ratio_low > 0 else np.inf
+            if (count_m1 > 0 and (high - low) / 2 <= max_error) or \
+                    (time_budget is not None and time.perf_counter() - started >= time_budget):
+                break
+        return SampleEntropy._entropy_from_counts(count_m, count_m1), low, high, n_pairs
+
+    @staticmethod
+    def _similar_pairs(rows, cols, emb_dim, tolerance, closed):
+        """
+        两组模板 (R, emb_dim + 1)、(C, emb_dim + 1) 之间长度 emb_dim 与 emb_dim + 1 的相似矩阵 (R, C)。
+        切比雪夫距离以 emb_dim 次广播的绝对差求得；tolerance 可为标量或每列一个 (C,)。
+        """
+        within = np.less_equal if closed else np.less
+        distances = np.abs(rows[:, None, 0] - cols[None, :, 0])
+        for k in range(1, emb_dim):
+            np.maximum(distances, np.abs(rows[:, None, k] - cols[None, :, k]), out=distances)
+        similar_m = within(distances, tolerance)
+        similar_m1 = similar_m & within(np.abs(rows[:, None, emb_dim] - cols[None, :, emb_dim]), tolerance)
+        return similar_m, similar_m1
+
+    @staticmethod
+    def _masked_counts(rows, cols, emb_dim, tolerance, closed, mask):
+        """
+        按行分块统计 mask 内的相似模板对数 (B, A)。
+        """
+        block = max(1, SampleEntropy.BLOCK_CELLS // len(cols))
+        count_m = count_m1 = 0
+        for a in range(0, len(rows), block):
+            similar_m, similar_m1 = SampleEntropy._similar_pairs(rows[a:a + block], cols, emb_dim, tolerance, closed)
+            count_m += np.count_nonzero(similar_m & mask[a:a + block])
+            count_m1 += np.count_nonzero(similar_m1 & mask[a:a + block])
+        return count_m, count_m1
+
+    @staticmethod
+    def _rolling_tolerances(data, emb_dim, window, starts):
+        """
+        以累积和求各窗口的样本标准差（近似值，与逐段 np.std 可能有舍入差异），再换算为默认容差。
+        """
+        centred = data - data.mean()
+        s1 = np.concatenate(([0.0], np.cumsum(centred)))
+        s2 = np.concatenate(([0.0], np.cumsum(centred**2)))
+        sums = s1[starts + window] - s1[starts]
+        squares = s2[starts + window] - s2[starts]
+        std = np.sqrt(np.maximum(0, squares - sums**2 / window) / (window - 1))
+        return std * 0.1164 * (0.5627 * np.log(emb_dim) + 1.3334)
+
+    @staticmethod
+    def sampen_sliding(data, emb_dim, window, step, tolerance=None, lag=1, closed=False, approximate=False,
+                       use_numba=True):
+        """
+        滑动窗口样本熵，增量维护相似模板对数 B（长度 emb_dim）与 A（长度 emb_dim + 1）：
+        窗口前进时减去离开模板参与的模板对，加上进入模板参与的模板对，每个窗口的代价为 O(step × W)。
+        步长较大时增量更新不再划算，直接逐窗口完整计数（见 sampen_windows 与 SLIDING_STEP_DIVISOR）。
+        :param data: 一维时间序列
+        :param emb_dim: 嵌入维度
+        :param window: 窗口长度（样本数）
+        :param step: 窗口步长
+        :param tolerance: 整个文件固定的容差；None 时由整个文件的标准差求默认容差
+        :param lag: 嵌入延迟
+        :param closed: True 时 d <= r 视为相似，否则 d < r
+        :param approximate: True 时容差随窗口的滚动标准差变化（忽略 tolerance）；
+                            每个模板对沿用其较晚模板进入窗口时的容差，因此结果为近似值
+        :param use_numba: 完整计数时是否在可用时使用 numba 编译核
+        :return: 每个窗口的样本熵数组
+        """
+        data = np.asarray(data, dtype=np.float64)
+        starts = np.arange(0, len(data) - window + 1, step)
+        N = window - emb_dim * lag
+        if approximate:
+            tolerances = SampleEntropy._rolling_tolerances(data, emb_dim, window, starts)
+        else:
+            if tolerance is None:
+                tolerance = SampleEntropy.default_tolerance(data, emb_dim)
+            tolerances = np.full(len(starts), tolerance, dtype=np.float64)
+        numba = use_numba and njit is not None
+        divisor = SampleEntropy.SLIDING_STEP_DIVISOR_NUMBA if numba else SampleEntropy.SLIDING_STEP_DIVISOR
+        if len(starts) == 0 or N < 2 or divisor * step >= N:
+            return SampleEntropy.sampen_windows(data, emb_dim, window, step, None if approximate else tolerance,
+                                                lag, closed, use_numba)
+
+        templates = SampleEntropy.embed(data, emb_dim + 1, lag)
+        # 每个模板进入窗口时的容差；模板对 (i, j), i < j 以 arrival[j] 判断是否相似
+        arrival = np.empty(len(templates), dtype=np.float64)
+        # 离开的模板只与其后的模板配对，进入的模板只与其前的模板配对
+        later = np.triu(np.ones((step, N), dtype=bool), k=1)
+        earlier = np.tri(step, N, k=N - step - 1, dtype=bool)
+        entropies = np.empty(len(starts))
+
+        start = starts[0]
+        arrival[start:start + N] = tolerances[0]
+        count_m, count_m1 = SampleEntropy.match_counts(
+            data[start:start + window], emb_dim, tolerances[0], lag, closed, use_numba)
+        entropies[0] = SampleEntropy._entropy_from_counts(count_m, count_m1)
+        for w in range(1, len(starts)):
+            previous, start = starts[w - 1], starts[w]
+            # 离开的模板 [previous, start) 与旧窗口中在其之后的模板
+            removed_m, removed_m1 = SampleEntropy._masked_counts(
+                templates[previous:start], templates[previous:previous + N], emb_dim, arrival[previous:previous + N],
+                closed, later)
+
+            # 进入的模板 [previous + N, start + N) 与新窗口中在其之前的模板
+            arrival[previous + N:start + N] = tolerances[w]
+            added_m, added_m1 = SampleEntropy._masked_counts(
+                templates[previous + N:start + N], templates[start:start + N], emb_dim, tolerances[w], closed, earlier)
+            count_m += added_m - removed_m
+            count_m1 += added_m1 - removed_m1
+            entropies[w] = SampleEntropy._entropy_from_counts(count_m, count_m1)
+        return entropies
+
+    @staticmethod
+    def sampen_windows(data, emb_dim, window, step, tolerance=None, lag=1, closed=False, use_numba=True):
+        """
+        按滑动窗口计算样本熵。安装 numba 时所有窗口在一次并行调用中完成，
+        否则逐窗口以 KD 树计数。每个窗口的结果与对该段单独调用 nolds.sampen 相同。
+        :param data: 一维时间序列
+        :param emb_dim: 嵌入维度
+        :param window: 窗口长度（样本数）
+        :param step: 窗口步长
+        :param tolerance: 容差；None 时每个窗口按各自的标准差计算（与逐段调用 nolds 一致）
+        :return: 每个窗口的样本熵数组
+        """
+        data = np.asarray(data, dtype=np.float64)
+        starts = np.arange(0, len(data) - window + 1, step)
+        if tolerance is None:
+            tolerances = np.array([SampleEntropy.default_tolerance(data[s:s + window], emb_dim) for s in starts])
+        else:
+            tolerances = np.full(len(starts), tolerance, dtype=np.float64)
+        n_templates = window - emb_dim * lag
+        if len(starts) == 0:
+            return np.empty(0)
+        if n_templates < 2:
+            return np.full(len(starts), np.nan)
+
+        if use_numba and njit is not None:
+            counts = _match_counts_kernel(data, starts, n_templates, emb_dim, lag, tolerances, closed)
+        else:
+            templates = SampleEntropy.embed(data, emb_dim + 1, lag)
+            counts = [SampleEntropy._kdtree_counts(templates[s:s + n_templates], emb_dim, r, closed)
+                      for s, r in zip(starts, tolerances)]
+        return np.array([SampleEntropy._entropy_from_counts(b, a) for b, a in counts])
+
+    @staticmethod
+    def _curve_tolerances(data, emb_dims, starts, window, tolerance):
+        """
+        每个窗口、每个维度的容差 (窗口数, 维度数)；tolerance 为 None 时按各窗口标准差与维度求默认容差。
+        """
+        if tolerance is not None:
+            return np.full((len(starts), len(emb_dims)), tolerance, dtype=np.float64)
+        return np.array([[SampleEntropy.default_tolerance(data[s:s + window], m) for m in emb_dims]
+                         for s in starts], dtype=np.float64).reshape(len(starts), len(emb_dims))
+
+    @staticmethod
+    def sampen_curve_windows(data, emb_dims, window, step, tolerance=None, lag=1, closed=False, use_numba=True):
+        """
+        按滑动窗口计算多个嵌入维度的样本熵曲线。安装 numba 时每个窗口只遍历一次模板对，
+        同时累计所有维度的计数；否则逐维度调用 sampen_windows。每个值与单独调用 nolds.sampen 相同。
+        :param data: 一维时间序列
+        :param emb_dims: 嵌入维度序列，如 range(1, 5)
+        :param window: 窗口长度（样本数）
+        :param step: 窗口步长
+        :param tolerance: 所有维度共用的容差；None 时每个窗口、每个维度各自求默认容差（与 nolds 一致）
+        :return: 形状为 (窗口数, len(emb_dims)) 的样本熵数组，列顺序与 emb_dims 相同
+        """
+        data = np.asarray(data, dtype=np.float64)
+        emb_dims = np.asarray(list(emb_dims), dtype=np.int64)
+        starts = np.arange(0, len(data) - window + 1, step)
+        entropies = np.full((len(starts), len(emb_dims)), np.nan)
+        if len(starts) == 0 or len(emb_dims) == 0:
+            return entropies
+        if not (use_numba and njit is not None):
+            for q, m in enumerate(emb_dims):
+                entropies[:, q] = SampleEntropy.sampen_windows(data, m, window, step, tolerance, lag, closed, False)
+            return entropies
+
+        # 去重并排序；模板数不足 2 的维度保持 nan
+        dims, columns = np.unique(emb_dims, return_inverse=True)
+        dims = dims[window - dims * lag >= 2]
+        if len(dims) == 0:
+            return entropies
+        tolerances = SampleEntropy._curve_tolerances(data, dims, starts, window, tolerance)
+        counts = _curve_counts_kernel(data, starts, window, dims, lag, tolerances, closed)
+        curve = np.array([[SampleEntropy._entropy_from_counts(b, a) for b, a in window_counts]
+                          for window_counts in counts]).reshape(len(starts), len(dims))
+        valid = columns < len(dims)
+        entropies[:, valid] = curve[:, columns[valid]]
+        return entropies
+
+    @staticmethod
+    def sampen_curve(data, emb_dims, tolerance=None, lag=1, closed=False, use_numba=True):
+        """
+        整个序列在多个嵌入维度下的样本熵曲线，参数同 sampen_curve_windows。
+        长序列（模板数超过 KDTREE_MIN_TEMPLATES）逐维度以 KD 树计数。
+        :return: 与 emb_dims 等长的样本熵数组
+        """
+        data = np.asarray(data, dtype=np.float64)
+        emb_dims = list(emb_dims)
+        if len(emb_dims) and len(data) - min(emb_dims) * lag >= SampleEntropy.KDTREE_MIN_TEMPLATES:
+            return np.array([SampleEntropy.sampen(data, m, tolerance, lag, closed, False) for m in emb_dims])
+        return SampleEntropy.sampen_curve_windows(data, emb_dims, len(data), 1, tolerance, lag, closed, use_numba)[0]
@@ -1,8 +1,10 @@
 import os
+import queue
 import threading
+import multiprocessing
 import pandas as pd
 import numpy as np
-import nolds
+from EntropyBatch import BatchExecutor, sampen_task
 import tkinter as tk
 from tkinter import filedialog, messagebox, scrolledtext, simpledialog
 from tkinter import ttk
@@ -11,6 +13,9 @@ from email.message import EmailMessage
 
 class EntropyApp:
     MAX_COLS = 5
+    TOLERANCE_MODES = ["Per Segment", "Fixed per File", "Rolling (approx.)"]
+    # 介面選項對應 sampen_task 的 tolerance 參數
+    TOLERANCE_KEYS = {"Per Segment": "segment", "Fixed per File": "file", "Rolling (approx.)": "rolling"}
 
     def __init__(self, master):
         self.master = master
@@ -50,7 +55,7 @@ class EntropyApp:
         # Parameters
         param_frame = ttk.Labelframe(container, text="Parameters", padding=10)
         param_frame.pack(fill='x', pady=5)
-        ttk.Label(param_frame, text="Embedding dimension (m):").grid(row=0, column=0, sticky='w')
+        ttk.Label(param_frame, text="Embedding dimension (m, e.g. 2 or 1-4):").grid(row=0, column=0, sticky='w')
         self.entry_m = ttk.Entry(param_frame, width=10)
         self.entry_m.insert(0, "1")
         self.entry_m.grid(row=0, column=1, sticky='w', padx=5)
@@ -76,6 +81,34 @@ class EntropyApp:
         self.output_style.set("Per Segment")
         self.output_style.grid(row=2, column=1, sticky='w')
 
+        # Per Segment 與逐段呼叫 nolds 相同；另兩種以增量計數加速小步長的滑動窗口
+        ttk.Label(self.win_enabled, text="Tolerance r:").grid(row=3, column=0, sticky='w')
+        self.tolerance_mode = ttk.Combobox(self.win_enabled, state="readonly", width=20, values=self.TOLERANCE_MODES)
+        self.tolerance_mode.set(self.TOLERANCE_MODES[0])
+        self.tolerance_mode.grid(row=3, column=1, sticky='w')
+
+        # 整段計算（不使用滑動窗口）時以隨機抽樣的模板對估計樣本熵，並輸出 95% 信賴區間
+        self.use_monte_carlo = tk.BooleanVar(value=False)
+        ttk.Checkbutton(param_frame, text="Monte-Carlo estimate for whole series (95% CI)", variable=self.use_monte_carlo, command=self.toggle_monte_carlo_options).grid(row=3, column=0, columnspan=3, sticky='w', pady=5)
+
+        self.mc_enabled = tk.Frame(param_frame)
+        self.mc_enabled.grid(row=4, column=0, columnspan=3, sticky='w')
+
+        ttk.Label(self.mc_enabled, text="Max error (±SampEn):").grid(row=0, column=0, sticky='w')
+        self.entry_mc_error = ttk.Entry(self.mc_enabled, width=10)
+        self.entry_mc_error.insert(0, "0.02")
+        self.entry_mc_error.grid(row=0, column=1, sticky='w', padx=5)
+
+        ttk.Label(self.mc_enabled, text="Time budget per column, all m (s, blank = none):").grid(row=1, column=0, sticky='w')
+        self.entry_mc_time = ttk.Entry(self.mc_enabled, width=10)
+        self.entry_mc_time.grid(row=1, column=1, sticky='w', padx=5)
+
+        # 平行處理的程序數；1 時在背景執行緒中依序計算
+        ttk.Label(param_frame, text="Workers:").grid(row=5, column=0, sticky='w')
+        self.entry_workers = ttk.Entry(param_frame, width=10)
+        self.entry_workers.insert(0, str(os.cpu_count() or 1))
+        self.entry_workers.grid(row=5, column=1, sticky='w', padx=5)
+
         # Output path
         ttk.Label(param_frame, text="Output File:").grid(row=6, column=0, sticky='w', pady=5)
         self.entry_output = ttk.Entry(param_frame, width=60)
@@ -90,17 +123,41 @@ class EntropyApp:
         self.progress.pack(fill='x', pady=5)
         self.log = scrolledtext.ScrolledText(progress_frame, height=15, wrap='word')
         self.log.pack(fill='both', expand=True)
+        self.progress_queue = queue.Queue()
+        BatchExecutor.poll_progress(master, self.progress_queue, self.log_message, self.progress)
 
         # Start button
         ttk.Button(container, text="Start Calculation", command=self.start).pack(pady=10)
 
         self.toggle_window_options()
+        self.toggle_monte_carlo_options()
+
+    @staticmethod
+    def parse_emb_dims(text):
+        """
+        解析嵌入維度：單一整數 "2"、範圍 "1-4" 或列表 "1,2,4"，回傳遞增且不重複的維度列表。
+        """
+        dims = set()
+        for part in text.replace(' ', '').split(','):
+            if '-' in part:
+                low, high = (int(v) for v in part.split('-', 1))
+                dims.update(range(low, high + 1))
+            else:
+                dims.add(int(part))
+        if not dims or min(dims) < 1:
+            raise ValueError(text)
+        return sorted(dims)
 
     def toggle_window_options(self):
         state = tk.NORMAL if self.use_window.get() else tk.DISABLED
         for child in self.win_enabled.winfo_children():
             child.configure(state=state)
 
+    def toggle_monte_carlo_options(self):
+        state = tk.NORMAL if self.use_monte_carlo.get() else tk.DISABLED
+        for child in self.mc_enabled.winfo_children():
+            child.configure(state=state)
+
     def browse_folder(self):
         folder = filedialog.askdirectory()
         if folder:
@@ -144,9 +201,9 @@ class EntropyApp:
         folder = self.entry_folder.get()
         output = self.entry_output.get()
         try:
-            m = int(self.entry_m.get())
+            m = self.parse_emb_dims(self.entry_m.get())
         except ValueError:
-            messagebox.showerror("Invalid m", "Embedding dimension must be integer.")
+            messagebox.showerror("Invalid m", "Embedding dimension must be a positive integer, range (1-4) or list (1,2,3).")
             return
         cols = [c.get() for c in self.combo_cols if c.get()]
         if not os.path.isdir(folder) or not cols or not output:
@@ -156,56 +213,74 @@ class EntropyApp:
         win_size = int(self.entry_win.get()) if use_window else None
         overlap = int(self.entry_ovl.get()) if use_window else None
         out_style = self.output_style.get() if use_window else None
-        threading.Thread(target=self.process_files, args=(folder, output, m, cols, use_window, win_size, overlap, out_style), daemon=True).start()
-
-    def process_files(self, folder, output, m, cols, use_window, win_size, overlap, out_style):
+        tol_mode = self.tolerance_mode.get() if use_window else None
+        try:
+            workers = int(self.entry_workers.get())
+        except ValueError:
+            messagebox.showerror("Invalid workers", "Workers must be an integer.")
+            return
+        monte_carlo = None
+        if self.use_monte_carlo.get() and not use_window:
+            try:
+                budget = self.entry_mc_time.get().strip()
+                monte_carlo = {'max_error': float(self.entry_mc_error.get()), 'time_budget': float(budget) if budget else None}
+            except ValueError:
+                messagebox.showerror("Invalid Monte-Carlo settings", "Max error and time budget must be numbers.")
+                return
+        threading.Thread(target=self.process_files, args=(folder, output, m, cols, use_window, win_size, overlap, out_style, tol_mode, workers, monte_carlo), daemon=True).start()
+
+    def process_files(self, folder, output, m, cols, use_window, win_size, overlap, out_style, tol_mode="Per Segment", workers=1, monte_carlo=None):
         files = [os.path.join(folder, f) for f in os.listdir(folder) if f.lower().endswith((".xls", ".xlsx", ".csv"))]
         self.progress['maximum'] = len(files)
         self.progress['value'] = 0
         results = []
 
-        for file in files:
+        # 檔案、欄位與窗口區塊分派到多個程序；Per Segment 的結果與逐段呼叫 nolds.sampen 相同，
+        # 其餘模式增量維護相似模板對數，r 固定於整個檔案或取滾動標準差（近似）
+        params = {'emb_dims': m, 'tolerance': self.TOLERANCE_KEYS.get(tol_mode, "segment"), 'monte_carlo': monte_carlo}
+        executor = BatchExecutor(sampen_task, params, win_size if use_window else None,
+                                 win_size - overlap if use_window else None, workers, self.progress_queue)
+        for file, file_result in zip(files, executor.run(files, cols)):
             basename = os.path.basename(file)
-            try:
-                df = pd.read_excel(file) if file.endswith(('.xls', '.xlsx')) else pd.read_csv(file)
-                row = {'Filename': basename}
-                logs = []
-                for col in cols:
-                    if col not in df.columns:
-                        logs.append(f"{col} skipped")
-                        continue
-
-                    data = df[col].dropna().values
-                    if use_window:
-                        s_list = []
-                        for start in range(0, len(data) - win_size + 1, win_size - overlap):
-                            seg = data[start:start+win_size]
-                            if len(seg) < m + 1: continue
-                            try:
-                                s = nolds.sampen(seg, emb_dim=m)
-                                s_list.append(s)
-                            except:
-                                s_list.append(np.nan)
-
+            if isinstance(file_result, Exception):
+                continue
+            row = {'Filename': basename}
+            logs = []
+            for col in cols:
+                if col not in file_result:
+                    logs.append(f"{col} skipped")
+                    continue
+
+                # m 為維度列表；只有一個維度時欄位名稱與以往相同，否則加上 " m=<維度>"
+                suffixes = [""] if len(m) == 1 else [f" m={d}" for d in m]
+                if use_window:
+                    curve = np.array(file_result[col]).reshape(-1, len(m))
+                    for s_list, suffix in zip(curve.T, suffixes):
                         if out_style == "Average Only":
-                            row[f"{col} SampEn_avg"] = np.nanmean(s_list)
+                            row[f"{col} SampEn_avg{suffix}"] = np.nanmean(s_list)
                         else:
                             for i, val in enumerate(s_list):
-                                row[f"{col}_seg{i+1}"] = val
-                        logs.append(f"{col} ({len(s_list)} segments)")
-                    else:
-                        s = nolds.sampen(data, emb_dim=m)
-                        row[f"{col} SampEn"] = s
-                        logs.append(f"{col}={s:.4f}")
-                results.append(row)
-                self.log_message(f"{basename}: " + ", ".join(logs))
-            except Exception as e:
-                self.log_message(f"Error {basename}: {e}")
-            self.progress['value'] += 1
+                                row[f"{col}_seg{i+1}{suffix}"] = val
+                    logs.append(f"{col} ({len(curve)} segments)")
+                elif monte_carlo:
+                    # 每個維度一列 (估計值, 信賴下限, 信賴上限)
+                    estimates = np.array(file_result[col][0]).reshape(len(m), 3)
+                    for (s, low, high), suffix in zip(estimates, suffixes):
+                        row[f"{col} SampEn{suffix}"] = s
+                        row[f"{col} SampEn CI low{suffix}"] = low
+                        row[f"{col} SampEn CI high{suffix}"] = high
+                    logs.append(f"{col}=" + "/".join(f"{s:.4f} [{low:.4f}, {high:.4f}]" for s, low, high in estimates))
+                else:
+                    curve = np.array(file_result[col]).reshape(-1, len(m))
+                    for s, suffix in zip(curve[0], suffixes):
+                        row[f"{col} SampEn{suffix}"] = s
+                    logs.append(f"{col}=" + "/".join(f"{s:.4f}" for s in curve[0]))
+            results.append(row)
+            self.progress_queue.put((len(files), len(files), f"{basename}: " + ", ".join(logs)))
 
         if results:
             pd.DataFrame(results).to_excel(output, index=False)
-            self.log_message(f"Saved to {output}")
+            self.progress_queue.put((len(files), len(files), f"Saved to {output}"))
             messagebox.showinfo("Completed", "Calculation finished.")
 
             # ✅ Email 寄送結果
@@ -242,6 +317,7 @@ class EntropyApp:
             self.log_message("❌ Email 發送失敗：" + str(e))
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     root = tk.Tk()
     app = EntropyApp(root)
     root.mainloop()
@@ -0,0 +1,120 @@
+"""
+SampEnOOP.SampleEntropy 与 nolds.sampen 的逐位对照。
+nolds 为可选依赖（pip install nolds），只有运行本脚本时需要；未安装时跳过。
+用法：python validate_sampen.py
+"""
+import sys
+import warnings
+
+import numpy as np
+
+from SampEnOOP import SampleEntropy, njit
+
+EMB_DIMS = (1, 2, 3, 4)
+LAGS = (1, 2)
+FIXED_TOLERANCE = 0.3
+WINDOW = 200
+STEP = 50
+
+
+def datasets(seed=0):
+    """
+    对照用的序列：一般信号、含大量重复值的量化信号、远离原点的信号，
+    以及计数为 0（返回 inf / -inf / nan）的退化输入。
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(400)
+    x = np.zeros(400)
+    for i in range(1, 400):
+        x[i] = 0.8 * x[i - 1] + rng.normal()
+    logistic = np.empty(300)
+    logistic[0] = 0.4
+    for i in range(1, 300):
+        logistic[i] = 3.9 * logistic[i - 1] * (1 - logistic[i - 1])
+    return {
+        "white noise": rng.normal(size=400),
+        "sine + noise": np.sin(t / 8) + 0.2 * rng.normal(size=400),
+        "random walk": np.cumsum(rng.normal(size=400)),
+        "AR(1)": x,
+        "logistic map": logistic,
+        "quantized": np.round(rng.normal(size=400) * 4) / 4,
+        "integers": rng.integers(0, 5, size=300).astype(np.float64),
+        "large offset": 1000 + rng.normal(size=300),
+        "short": rng.normal(size=30),
+        "very short": rng.normal(size=12),
+        "alternating": np.tile([0.0, 1.0], 50),
+        "constant": np.ones(100),
+    }
+
+
+def same(a, b):
+    # inf / nan 也要一致
+    return bool(np.array_equal(np.asarray(a, dtype=np.float64), np.asarray(b, dtype=np.float64), equal_nan=True))
+
+
+def compare_sampen(nolds, use_numba):
+    """
+    逐一比较 sampen：嵌入维度 × 延迟 × 开/闭区间 × 默认/固定容差 × 各序列。
+    :return: (相同个数, 总数, 不同的用例列表)
+    """
+    matched, total, failures = 0, 0, []
+    for name, data in datasets().items():
+        for m in EMB_DIMS:
+            for lag in LAGS:
+                for closed in (False, True):
+                    for tolerance in (None, FIXED_TOLERANCE):
+                        expected = nolds.sampen(data, emb_dim=m, tolerance=tolerance, lag=lag, closed=closed)
+                        actual = SampleEntropy.sampen(data, m, tolerance, lag, closed, use_numba=use_numba)
+                        total += 1
+                        if same(actual, expected):
+                            matched += 1
+                        else:
+                            failures.append((name, m, lag, closed, tolerance, actual, expected))
+    return matched, total, failures
+
+
+def compare_windows(nolds, use_numba):
+    """
+    比较 sampen_windows 与对每段单独调用 nolds.sampen 的结果（每个窗口各自的默认容差）。
+    """
+    matched, total, failures = 0, 0, []
+    for name, data in datasets().items():
+        if len(data) < WINDOW:
+            continue
+        starts = range(0, len(data) - WINDOW + 1, STEP)
+        for m in EMB_DIMS:
+            actual = SampleEntropy.sampen_windows(data, m, WINDOW, STEP, use_numba=use_numba)
+            expected = [nolds.sampen(data[s:s + WINDOW], emb_dim=m) for s in starts]
+            total += 1
+            if same(actual, expected):
+                matched += 1
+            else:
+                failures.append((name, m, actual, expected))
+    return matched, total, failures
+
+
+def main():
+    try:
+        import nolds
+    except ImportError:
+        print("nolds is not installed; skipping the SampEn comparison (pip install nolds).")
+        return 0
+
+    paths = [False] + ([True] if njit is not None else [])
+    ok = True
+    with warnings.catch_warnings():
+        # 计数为 0 时 nolds 会发出 RuntimeWarning
+        warnings.simplefilter("ignore")
+        for use_numba in paths:
+            label = "numba" if use_numba else "KD-tree"
+            for title, compare in (("sampen", compare_sampen), ("sampen_windows", compare_windows)):
+                matched, total, failures = compare(nolds, use_numba)
+                print(f"{title} ({label}): {matched}/{total} identical to nolds.sampen")
+                for failure in failures:
+                    print("  mismatch:", failure)
+                ok = ok and not failures
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())